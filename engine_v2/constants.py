@@ -35,9 +35,49 @@ ERROR_MARGIN = 0.0125
 MIN_DRAW_FPS = 30
 MAX_DRAW_FPS = 60
 
+# Only redraw and upload the changed parts of the window (faster with
+# software rendering). When more than DIRTY_RECTS_THRESHOLD of the window
+# has changed, the whole window is updated instead
+DIRTY_RECTS = False
+DIRTY_RECTS_THRESHOLD = 0.5
+
 COORDINATE_PRECISION = 4  # Decimals places of coordinates being stored
 SIMULATION_FRAMES_PER_DRAW = 5
 
+# Run the simulation with a fixed timestep of 1/PHYSICS_HZ seconds, no
+# matter how fast the game is being drawn (see engine_v2/timestep.py)
+FIXED_TIMESTEP = True
+PHYSICS_HZ = 300
+MAX_PHYSICS_STEPS_PER_DRAW = 30  # Steps beyond that will be dropped
+
 # Careful: The more frames per seconds are being simulated the smaller
 #          the changes in position and velocity will be therefore the
 #          COORDINATE_PRECISION has to be higher!
+
+SPATIAL_GRID_CELL_SIZE = 2  # meter, cell size of the barrier grid
+
+# Merge touching barriers with the same color into larger rectangles
+# after the level has been built (see Barrier.coalesce_all)
+COALESCE_BARRIERS = True
+
+# Sweep the moving objects from their last to their new position when
+# detecting barrier collisions. Then only one simulation frame per
+# drawing is needed, since nothing can pass through thin barriers
+CONTINUOUS_COLLISIONS = False
+
+# Simulate the enemies with NumPy arrays (v7/enemy_swarm.py) instead
+# of one Enemy object per enemy. Requires NumPy to be installed
+NUMPY_ENEMIES = False
+
+# Let all enemies share the rows of one precomputed noise bank instead
+# of generating their own perlin noise (engine_v2/noise_bank.py).
+# Requires NumPy to be installed
+NOISE_BANK = False
+NOISE_BANK_ROWS = 1024
+NOISE_BANK_SEED = 0
+NOISE_BANK_CACHE = None  # e.g. "noise_bank.npz" to only generate it once
+
+# Give every enemy an endless PerlinNoiseStream (engine_v2/perlin.py)
+# instead of a repeating PerlinNoise1D, e.g. for long-running servers.
+# Ignored when NOISE_BANK or NUMPY_ENEMIES is set
+NOISE_STREAM = False
@@ -3,6 +3,7 @@
 import pygame
 from pygame import gfxdraw
 import sys
+from collections import OrderedDict
 
 # Engine
 from engine_v2.tests import TEST_optional_coordinates, TEST_color, TEST_object_attributes
@@ -34,38 +35,91 @@ class Game():
             self, width=500, height=500,
             title="MyGame", font_family='Roboto',
             track_fps=True, print_fps=True,
-            max_fps=240
+            max_fps=240, text_cache_budget=4 * 2**20,
+            dirty_rects=False, dirty_rects_threshold=DIRTY_RECTS_THRESHOLD,
+            headless=False
     ):
 
         self.width = width
         self.height = height
         self.font_family = font_family
 
+        # Looking up a font and rendering a text is slow. That is why all
+        # fonts ({(font_family, font_size): font, ...}) and the recently
+        # rendered texts ({(text, font_family, font_size, color): surface,
+        # ...}, least recently used first) are cached. The text cache
+        # is limited to text_cache_budget bytes
+        self.fonts = {}
+        self.text_surfaces = OrderedDict()
+        self.text_cache_bytes = 0
+        self.text_cache_budget = text_cache_budget
+
+        # All elements that never move (background, barriers, ...) are
+        # drawn once onto this surface (see draw_static_layer)
+        self.static_layer = None
+        self.static_layer_version = None
+
+        # With dirty_rects=True only the parts of the window that have
+        # changed are restored from the static layer and uploaded to the
+        # display. If these parts cover more than dirty_rects_threshold
+        # of the window, the whole window is updated instead
+        self.dirty_rects_enabled = dirty_rects
+        self.dirty_rects_threshold = dirty_rects_threshold
+        self.dirty_rects = []
+        self.previous_dirty_rects = []
+        self.full_update = True
+
+        # Statistics to see whether the caches are working
+        self.font_cache_hits = 0
+        self.font_cache_misses = 0
+        self.text_cache_hits = 0
+        self.text_cache_misses = 0
+
         if track_fps:
             self.clock = pygame.time.Clock()
             self.max_fps = max_fps
             self.fps = max_fps
+
+            # The actual time (in seconds) of the last frame
+            self.timedelta = 0
         else:
             assert not print_fps, "Cannot print_fps without track_fps=True"
 
         self.track_fps = track_fps
         self.print_fps = print_fps
 
+        # A headless game has no window at all (e.g. for simulations on
+        # a server without a display). Nothing can be drawn then
+        self.headless = headless
+        if headless:
+            self.window = None
+            self.display_surface = None
+            return
+
         pygame.init()
         self.window = pygame.display.set_mode((width, height), DOUBLEBUF)
+        self.display_surface = self.window
         pygame.display.set_caption(title)
 
         # Has to be called to use fonts at some point
         pygame.font.init()
 
+    # Remembers which part of the window has been drawn on during the
+    # current frame (only needed with dirty_rects=True)
+    def add_dirty_rect(self, rect):
+        if self.dirty_rects_enabled and self.window is self.display_surface:
+            self.dirty_rects.append(pygame.Rect(rect).clip(self.window.get_rect()))
+
     def draw_rect(self, x, y, width, height, color=(0, 0, 0), alpha=1):
         gfxdraw.box(self.window, (x, y, width, height), list(color) + [int(alpha * 255)])
+        self.add_dirty_rect((math.floor(x), math.floor(y), math.ceil(width) + 1, math.ceil(height) + 1))
 
     def draw_circle(self, x, y, radius, color=(0, 0, 0)):
         x, y, radius = math.ceil(x), math.ceil(y), math.ceil(radius)
         try:
             gfxdraw.aacircle(self.window, x, y, radius, color)
             gfxdraw.filled_circle(self.window, x, y, radius, color)
+            self.add_dirty_rect((x - radius - 1, y - radius - 1, 2 * radius + 3, 2 * radius + 3))
         except:
             print(f"x={x}, y={y}, radius={radius}, color={color}")
             sys.exit()
@@ -74,6 +128,34 @@ class Game():
         gfxdraw.aapolygon(game_window, points, color)
         gfxdraw.filled_polygon(game_window, points, color)
 
+    def get_font(self, font_family, font_size):
+        key = (font_family, font_size)
+        if key in self.fonts:
+            self.font_cache_hits += 1
+        else:
+            self.font_cache_misses += 1
+            self.fonts[key] = pygame.font.SysFont(font_family, font_size)
+        return self.fonts[key]
+
+    def render_text(self, text, font_family, font_size, color):
+        key = (text, font_family, font_size, tuple(color))
+        if key in self.text_surfaces:
+            self.text_cache_hits += 1
+            self.text_surfaces.move_to_end(key)
+            return self.text_surfaces[key]
+
+        self.text_cache_misses += 1
+        surface = self.get_font(font_family, font_size).render(text, True, color)
+        self.text_surfaces[key] = surface
+        self.text_cache_bytes += surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+        # Remove the least recently used texts when over budget
+        while self.text_cache_bytes > self.text_cache_budget and len(self.text_surfaces) > 1:
+            old_key, old_surface = self.text_surfaces.popitem(last=False)
+            self.text_cache_bytes -= old_surface.get_width() * old_surface.get_height() * old_surface.get_bytesize()
+
+        return surface
+
     # You can pass in either the texts center coordinates or it edge coordinates
     # or not coordinates at all for both dimensions. In the last case the text will
     # be places in the windows center
@@ -89,8 +171,7 @@ class Game():
             y_top=y_top, y_center=y_center, y_bottom=y_bottom
         )
 
-        font = pygame.font.SysFont(self.font_family if font_family is None else font_family, font_size)
-        surface = font.render(text, True, color)
+        surface = self.render_text(text, self.font_family if font_family is None else font_family, font_size, color)
         (rx, ry, rw, rh) = surface.get_rect()  # The rectangle enclosing the text
 
         if all([x is None for x in (x_left, x_center, x_right)]):
@@ -115,11 +196,37 @@ class Game():
         else:
             assert False, "Logic is wrong"
 
-        self.window.blit(surface, (x, y))
+        self.add_dirty_rect(self.window.blit(surface, (x, y)))
 
     def draw_background(self, color=(255, 255, 255)):
         TEST_color(color)
         self.window.fill(color)
+        if self.window is self.display_surface:
+            self.full_update = True
+
+    # Draws everything that draw_function draws, but only calls
+    # draw_function when version has changed. Otherwise the cached
+    # result is being drawn with a single blit.
+    #
+    # Use it for all elements that never move and increment the version
+    # whenever one of these elements has changed
+    def draw_static_layer(self, version, draw_function):
+        if self.static_layer is None or self.static_layer_version != version:
+            # Redirect all drawing methods onto the static layer
+            window = self.window
+            self.window = pygame.Surface((self.width, self.height)).convert()
+            draw_function()
+            self.static_layer, self.window = self.window, window
+            self.static_layer_version = version
+            self.full_update = True
+
+        if self.dirty_rects_enabled and not self.full_update:
+            # Only erase what has been drawn during the last frame
+            for rect in self.previous_dirty_rects:
+                self.window.blit(self.static_layer, rect, rect)
+        else:
+            self.window.blit(self.static_layer, (0, 0))
+            self.full_update = True
 
     def update(self):
         # 1. Update fps
@@ -127,14 +234,32 @@ class Game():
             # self.fps converges towards the actual fps -> reduces noise in fps
             timedelta = self.clock.tick(self.max_fps) * 0.001
             new_fps = round((self.fps*5 + (1/timedelta))/6)
+            self.timedelta = timedelta
 
             if self.print_fps and self.fps != new_fps:
                 print("{:3d} FPS".format(round(new_fps)))
 
             self.fps = new_fps
 
-        # 2. Update game window
-        pygame.display.update()
+        # 2. Update game window (there is none in headless mode)
+        if self.headless:
+            return
+
+        if self.dirty_rects_enabled and not self.full_update:
+            # The parts drawn on last frame (which have been erased) and
+            # the parts drawn on in this frame have changed
+            changed_rects = self.previous_dirty_rects + self.dirty_rects
+            changed_area = sum(rect.width * rect.height for rect in changed_rects)
+            if changed_area > self.dirty_rects_threshold * self.width * self.height:
+                pygame.display.update()
+            else:
+                pygame.display.update(changed_rects)
+        else:
+            pygame.display.update()
+
+        self.previous_dirty_rects = self.dirty_rects
+        self.dirty_rects = []
+        self.full_update = False
 
     def get_mouse_position(self):
         if pygame.mouse.get_focused() == 0:
@@ -188,7 +313,7 @@ class Game():
 
     def draw_sprite(self, image, center_position):
         width, height = image.get_rect()[2:]
-        self.window.blit(image, (center_position[0]-(width/2), center_position[1]-(height/2)))
+        self.add_dirty_rect(self.window.blit(image, (center_position[0]-(width/2), center_position[1]-(height/2))))
 
     def draw_sprite_element(self, image, center_position, sprite_offset=(0, 0)):
         center_position = [
@@ -0,0 +1,205 @@
+
+import os
+import math
+import random
+import numpy as np
+
+from engine_v2.perlin import WIDTH
+from engine_v2.perlin_numpy import generate_noise_batch
+from engine_v2.numpy_helpers import round_like_python
+from engine_v2.tests import *
+
+# Constants
+from engine_v2.constants import *
+
+
+"""
+A bank of precomputed, seeded perlin noise rows that can be shared
+by any number of enemies (requires NumPy to be installed).
+
+    bank = NoiseBank(rows=1024, value_range=(-4, 4), seed=0)
+    row_index, phase = bank.assign()
+    noise = bank.row(row_index)  # Can be used like a PerlinNoise1D
+    noise[phase + 0.5]
+
+Instead of generating its own PerlinNoise1D every enemy only gets a row
+index and a phase offset (where in that row it starts). Creating an
+enemy does not allocate any noise and the memory stays the same no
+matter how many enemies there are.
+
+bank.sample(row_indices, noise_indices) samples the noise of many
+enemies with one vectorized gather (used by v7/enemy_swarm.py).
+
+With cache_path the bank is only generated once and loaded from that
+file afterwards (as long as rows, width, value_range and seed match).
+"""
+
+
+class NoiseBank:
+
+    def __init__(
+            self, rows=NOISE_BANK_ROWS, width=None,
+            value_range=(0, 1), seed=NOISE_BANK_SEED,
+            decimal_places=6, cache_path=None
+    ):
+        if width is None:
+            width = WIDTH
+
+        assert isinstance(rows, int) and rows > 0, "rows has to be an integer greater than 0"
+        assert isinstance(width, int) and width > 1, "width has to be an integer greater than 1"
+        TEST_value_range(value_range)
+        assert \
+            cache_path is None or seed is not None, \
+            "A noise bank without a seed cannot be cached"
+
+        self.rows = rows
+        self.width = width
+        self.value_range = value_range
+        self.seed = seed
+        self.decimal_places = decimal_places
+
+        self.noise = None
+        if cache_path is not None and os.path.isfile(cache_path):
+            self.noise = self.load(cache_path)
+
+        if self.noise is None:
+            self.noise = generate_noise_batch(
+                rows, width=width, value_range=value_range,
+                decimal_places=decimal_places, repeatable=True, rng=seed
+            )
+            if cache_path is not None:
+                self.save(cache_path)
+
+        # The same rows as Python lists for sampling single values
+        # (indexing NumPy arrays with scalars is slow)
+        self.noise_lists = self.noise.tolist()
+
+        # Hands out the rows and phase offsets (same seed -> same
+        # assignments in the same order)
+        self.random = random.Random(seed)
+
+    def get_metadata(self):
+        return np.array([self.rows, self.width, *self.value_range, self.seed, self.decimal_places], dtype=float)
+
+    # Returns None if the file has been generated with other parameters
+    def load(self, cache_path):
+        with np.load(cache_path) as cache:
+            if np.array_equal(cache["metadata"], self.get_metadata()):
+                return cache["noise"]
+        return None
+
+    def save(self, cache_path):
+        np.savez(cache_path, noise=self.noise, metadata=self.get_metadata())
+
+    # Returns a (row_index, phase) for a new enemy
+    def assign(self):
+        return self.random.randrange(self.rows), self.random.uniform(0, self.width - 1)
+
+    def row(self, row_index):
+        assert 0 <= row_index < self.rows, "row_index must be in range(0, rows)"
+        return NoiseBankRow(self, row_index)
+
+    # Vectorized version of NoiseBankRow.get for many (row_index,
+    # noise_index) pairs at once (with exactly the same rounding)
+    def sample(self, row_indices, noise_indices):
+        left_indices = np.floor(noise_indices).astype(int)
+        right_indices = np.ceil(noise_indices).astype(int)
+        left_values = self.noise[row_indices, left_indices]
+        return np.where(
+            left_indices == right_indices,
+            left_values,
+            round_like_python(
+                left_values * (right_indices - noise_indices) +
+                self.noise[row_indices, right_indices] * (noise_indices - left_indices),
+                self.decimal_places
+            )
+        )
+
+    def __len__(self):
+        return self.rows
+
+
+# A single row of a NoiseBank with the same interface as PerlinNoise1D
+class NoiseBankRow:
+
+    __slots__ = ("bank", "row_index")
+
+    def __init__(self, bank, row_index):
+        self.bank = bank
+        self.row_index = row_index
+
+    @property
+    def width(self):
+        return self.bank.width
+
+    def get(self, x):
+        assert 0 <= x <= self.bank.width - 1, "x must be in range(0, width)"
+
+        noise = self.bank.noise_lists[self.row_index]
+        if int(x) == x:
+            return noise[int(x)]
+        else:
+            # Basic linear interpolation
+            left_index = math.floor(x)
+            right_index = math.ceil(x)
+            return round(
+                noise[left_index] * (right_index - x) +
+                noise[right_index] * (x - left_index),
+                self.bank.decimal_places
+            )
+
+    def __getitem__(self, x):
+        return self.get(x)
+
+    def array(self):
+        return self.bank.noise[self.row_index]
+
+
+if __name__ == '__main__':
+    # Benchmark: One PerlinNoise1D per enemy vs. rows of one shared bank
+    # (construction time and allocated memory for the noise)
+    import time
+    import tracemalloc
+    from engine_v2.perlin import PerlinNoise1D
+
+    start_time = time.perf_counter()
+    bank = NoiseBank(value_range=(-4, 4))
+    print(f"NoiseBank with {bank.rows} rows generated in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+
+    for count in (1000, 10000, 100000):
+        variants = [("NoiseBank", lambda: bank.row(bank.assign()[0]))]
+        if count <= 1000:
+            variants.insert(0, ("PerlinNoise1D", lambda: PerlinNoise1D(value_range=(-4, 4), repeatable=True)))
+
+        for name, create_noise in variants:
+            tracemalloc.start()
+            start_time = time.perf_counter()
+            noises = [create_noise() for i in range(count)]
+            duration = time.perf_counter() - start_time
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print(
+                f"{count:>6} enemies {name:>13}: {duration * 1000:9.1f} ms, "
+                f"{memory / 2**20:7.2f} MiB ({memory / count:6.0f} bytes per enemy)"
+            )
+            del noises
+
+    # One vectorized gather for 100k enemies vs. sampling row by row, both
+    # have to be exactly the same (half of the noise indices like the
+    # ones of an enemy: a phase plus a multiple of 1.5/300 per step)
+    row_indices = np.random.randint(0, bank.rows, 100000)
+    noise_indices = np.concatenate([
+        np.random.uniform(0, bank.width - 1, 50000),
+        (np.random.uniform(0, bank.width - 1, 50000) + np.arange(50000) * (1.5/300)) % (bank.width - 1)
+    ])
+    start_time = time.perf_counter()
+    values = bank.sample(row_indices, noise_indices)
+    duration_gather = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    single_values = [bank.row(r)[x] for r, x in zip(row_indices, noise_indices)]
+    duration_single = time.perf_counter() - start_time
+    assert np.array_equal(values, single_values), "The gather differs from sampling row by row"
+    print(
+        f"Sampling 100000 enemies: {duration_gather * 1000:.2f} ms (gather) "
+        f"{duration_single * 1000:.1f} ms (row by row)"
+    )
@@ -0,0 +1,56 @@
+import numpy as np
+
+
+"""
+Helpers for the optional NumPy code paths (requires NumPy to be
+installed). The NumPy code has to produce exactly the same values as the
+plain Python code, otherwise snapshots, replays and netplay (which all
+rely on a deterministic simulation) break as soon as both are mixed.
+"""
+
+
+# The same as round(value, decimal_places) for every value of an array.
+#
+# np.round(values, decimal_places) is not: It multiplies the values by
+# 10**decimal_places (which is rounded to the nearest float) and then
+# rounds half to even. Python rounds the exact value of every float,
+# e.g. round(-148.27095, 4) = -148.2709 but np.round gives -148.271.
+#
+# The scaled value is off by at most one rounding error, so it can only
+# be rounded to the wrong side when it is that close to x.5 - only these
+# (rare) values are rounded with Python's round
+def round_like_python(values, decimal_places):
+    scale = 10.0 ** decimal_places
+    scaled = values * scale
+    result = np.rint(scaled) / scale
+
+    distance_to_half = np.abs(scaled - np.floor(scaled) - 0.5)
+    for i in np.flatnonzero(distance_to_half <= np.abs(scaled) * 2.0**-50):
+        result.flat[i] = round(float(values.flat[i]), decimal_places)
+    return result
+
+
+if __name__ == '__main__':
+    # Test: Exactly the same values as Python's round, also for the values
+    # right next to x.5 where np.round is wrong. Benchmark vs. np.round
+    import random
+    import time
+
+    random.seed(0)
+    values = np.array(
+        [random.uniform(-200, 200) for i in range(100000)] +
+        [round(random.uniform(-200, 200), 4) + 0.00005 for i in range(100000)] +
+        [-148.27095, 0.00005, -0.00005, 2.5e-05, 0.0, -0.0, 1e-12, -1e-12]
+    )
+
+    expected = [round(value, 4) for value in values.tolist()]
+    result = round_like_python(values, 4)
+    assert [repr(value) for value in result.tolist()] == [repr(value) for value in expected], "Differs from round()"
+    numpy_differences = int(np.sum(np.round(values, 4) != np.array(expected)))
+    print(f"{len(values)} values: same as round(), np.round differs for {numpy_differences}")
+
+    for name, function in (("np.round", np.round), ("round_like_python", round_like_python)):
+        start_time = time.perf_counter()
+        for i in range(10):
+            function(values[:100000], 4)
+        print(f"{name:>17}: {(time.perf_counter() - start_time) / 10 * 1e3:6.2f} ms for 100000 random values")
@@ -62,14 +62,19 @@ class PerlinNoise1D():
 
 
     def generate_noise(self):
-        random_array = [random.random() for i in range(self.width + 1)]
+        # The layers can only be interpolated on a width that is dividable
+        # by all weight keys -> interpolate them on the next larger width
+        # like that and only use the first (width + 1) values
+        layer_width = math.ceil(self.width / math.lcm(*self.weights)) * math.lcm(*self.weights)
+
+        random_array = [random.random() for i in range(layer_width + 1)]
         noise_array = [0] * (self.width + 1)
 
         # Add the weighted noise for each layers described in weights
         for sections_count in self.weights:
             weight = self.weights[sections_count]
 
-            sections_width = int(self.width/sections_count)
+            sections_width = int(layer_width/sections_count)
 
             # Get noise array for this layer
             sample_array = [
@@ -86,11 +91,11 @@ class PerlinNoise1D():
                 noise_array[noise_index] += interpolated_array[noise_index] * weight
 
         if self.repeatable:
-            difference = noise_array[127] - noise_array[0]
+            difference = noise_array[self.width - 1] - noise_array[0]
             corrector = lambda i: round(
-                (i * (difference / 127)), self.decimal_places
+                (i * (difference / (self.width - 1))), self.decimal_places
             )
-            noise_array = [noise_array[i] - corrector(i) for i in range(128)]
+            noise_array = [noise_array[i] - corrector(i) for i in range(self.width)]
 
         # 1. Normalize array to (0, 1)
         # 2. Scale array to actual size
@@ -104,7 +109,7 @@ class PerlinNoise1D():
             for x in noise_array
         ]
 
-        return noise_array[:128]
+        return noise_array[:self.width]
 
     @staticmethod
     def interpolated_scaling(array, scaling_factor):
@@ -161,7 +166,173 @@ class PerlinNoise1D():
         self.noise = self.generate_noise()
 
     def array(self):
-        return self.noise[:128]
+        return self.noise[:self.width]
+
+
+"""
+PerlinNoiseStream generates the same kind of noise lazily, chunk by
+chunk, so it never repeats and never has to be allocated at once:
+
+    noise = PerlinNoiseStream(value_range=(-4, 4), seed=42)
+    noise[1000.5]  # Can be accessed with any x >= 0
+
+Every chunk is generated from its own generator (seeded with the seed
+and the chunk index), so the noise at any x only depends on the seed and
+chunks that have been discarded can simply be generated again. Each
+layer ends with the first sample of the same layer in the next chunk, so
+there are no jumps at the chunk borders.
+
+Like PerlinNoise1D, the noise is normalized by its minimum and maximum.
+At every chunk border these are the minimum/maximum of the two chunks
+next to it, within a chunk they are interpolated from one border to the
+next one (so there are no jumps and all values stay within value_range).
+
+Only the max_chunks chunks closest to the last generated one are being
+kept, so x should mostly grow (like the noise_index of an enemy).
+"""
+class PerlinNoiseStream():
+
+    # The noise has no end
+    width = None
+
+    def __init__(
+            self,
+            weights=None, value_range=None, decimal_places=6,
+            chunk_width=None, seed=None, max_chunks=4
+    ):
+
+        if chunk_width is None:
+            chunk_width = WIDTH
+
+        if weights is None:
+            weights = WEIGHTS
+        else:
+            TEST_perlin_weights(chunk_width, weights)
+
+        if value_range is None:
+            value_range = VALUE_RANGE
+        else:
+            TEST_value_range(value_range)
+
+        assert \
+            all([int(chunk_width/key) == (chunk_width/key) for key in weights]), \
+            "The chunk_width must be dividable by all weight keys"
+        assert isinstance(max_chunks, int) and max_chunks >= 2, "max_chunks has to be an integer >= 2"
+
+        # Same seed -> same noise. Without a seed it is taken from the
+        # global generator, so random.seed() still makes it reproducible
+        if seed is None:
+            seed = random.getrandbits(64)
+
+        self.weights = weights
+        self.value_range = value_range
+        self.decimal_places = decimal_places
+        self.chunk_width = chunk_width
+        self.max_chunks = max_chunks
+        self.seed = seed
+
+        # {chunk_index: [value, ...], ...} with the most recent chunks and
+        # {chunk_index: (min, max), ...} of their raw values
+        self.chunks = {}
+        self.chunk_limits = {}
+
+    # The generator of a chunk, its first draws are the samples at the
+    # start of the chunk (one per layer)
+    def chunk_random(self, chunk_index):
+        return random.Random(self.seed * 2**32 + chunk_index)
+
+    # The weighted sum of all layers (not normalized yet)
+    def generate_raw_chunk(self, chunk_index):
+        chunk_random = self.chunk_random(chunk_index)
+        next_chunk_random = self.chunk_random(chunk_index + 1)
+        first_samples = {sections_count: chunk_random.random() for sections_count in self.weights}
+        last_samples = {sections_count: next_chunk_random.random() for sections_count in self.weights}
+
+        noise_array = [0] * self.chunk_width
+        for sections_count in self.weights:
+            weight = self.weights[sections_count]
+
+            sections_width = int(self.chunk_width/sections_count)
+
+            # Get noise array for this layer (ending where the next chunk starts)
+            sample_array = [first_samples[sections_count]] + [
+                chunk_random.random() for i in range(sections_count - 1)
+            ] + [last_samples[sections_count]]
+            interpolated_array = PerlinNoise1D.interpolated_scaling(
+                sample_array, sections_width
+            )
+
+            # Get noise layer to overall noise array
+            for noise_index in range(self.chunk_width):
+                noise_array[noise_index] += interpolated_array[noise_index] * weight
+
+        return noise_array
+
+    def get_limits(self, chunk_index):
+        if chunk_index not in self.chunk_limits:
+            raw_chunk = self.generate_raw_chunk(chunk_index)
+            self.chunk_limits[chunk_index] = (min(raw_chunk), max(raw_chunk))
+        return self.chunk_limits[chunk_index]
+
+    def generate_chunk(self, chunk_index):
+        noise_array = self.generate_raw_chunk(chunk_index)
+        self.chunk_limits[chunk_index] = (min(noise_array), max(noise_array))
+        previous_limits = self.get_limits(chunk_index - 1)
+        current_limits = self.chunk_limits[chunk_index]
+        next_limits = self.get_limits(chunk_index + 1)
+
+        # The limits at the start and at the end of this chunk
+        start_min = min(previous_limits[0], current_limits[0])
+        start_max = max(previous_limits[1], current_limits[1])
+        end_min = min(current_limits[0], next_limits[0])
+        end_max = max(current_limits[1], next_limits[1])
+
+        # 1. Normalize array to (0, 1) with the interpolated limits
+        # 2. Scale array to actual size
+        # 3. Translate array to actual offset
+        scaling = self.value_range[1] - self.value_range[0]
+        translation_offset = self.value_range[0]
+        chunk = []
+        for i, x in enumerate(noise_array):
+            t = i / self.chunk_width
+            min_value = start_min + (end_min - start_min) * t
+            max_value = start_max + (end_max - start_max) * t
+            value = ((x - min_value) / (max_value - min_value)) * scaling + translation_offset
+            chunk.append(round(value, self.decimal_places))
+        self.chunks[chunk_index] = chunk
+
+        # Only keep the chunks closest to the one just generated
+        while len(self.chunks) > self.max_chunks:
+            del self.chunks[max(self.chunks, key=lambda i: abs(i - chunk_index))]
+        for old_index in [i for i in self.chunk_limits if all(abs(i - j) > 1 for j in self.chunks)]:
+            del self.chunk_limits[old_index]
+
+    def get_value(self, index):
+        chunk_index = index // self.chunk_width
+        if chunk_index not in self.chunks:
+            self.generate_chunk(chunk_index)
+        return self.chunks[chunk_index][index % self.chunk_width]
+
+    def get(self, x):
+        assert isinstance(x, int) or isinstance(x, float), "x must be of type integer or float"
+        assert x >= 0, "x must be >= 0"
+
+        if int(x) == x:
+            return self.get_value(int(x))
+        else:
+            # Basic linear interpolation
+            left_index = math.floor(x)
+            right_index = math.ceil(x)
+            left_weight = right_index - x
+            right_weight = x - left_index
+            return round(
+                self.get_value(left_index) * left_weight +
+                self.get_value(right_index) * right_weight,
+                self.decimal_places
+            )
+
+    def __getitem__(self, x):
+        return self.get(x)
 
 
 if __name__ == '__main__':
@@ -171,11 +342,19 @@ if __name__ == '__main__':
     # With repeatable set to True the array has the same start and end value
     noise = PerlinNoise1D(value_range=(0, 1), repeatable=True)
 
-    plt.plot(list(range(0, 128)), noise[:])
+    plt.plot(list(range(0, noise.width)), noise[:])
 
     # Test if repeatable setting
-    plt.plot(list(range(127, -1, -1)), noise.array())
+    plt.plot(list(range(noise.width - 1, -1, -1)), noise.array())
 
     # Test if slices work
     plt.plot(list(range(0, 80)), noise[:80])
+
+    # A wider noise (width does not have to be a power of 2 anymore)
+    wide_noise = PerlinNoise1D(width=300, value_range=(0, 1))
+    plt.plot(list(range(0, wide_noise.width)), wide_noise.array())
+
+    # The stream has no visible jumps at the chunk borders (every 128)
+    stream = PerlinNoiseStream(value_range=(0, 1), seed=0)
+    plt.plot([x/4 for x in range(1200)], [stream[x/4] for x in range(1200)])
     plt.show()
@@ -0,0 +1,121 @@
+
+import math
+import numpy as np
+
+from engine_v2.perlin import WIDTH, WEIGHTS, VALUE_RANGE
+from engine_v2.tests import *
+
+
+"""
+The same 1D perlin noise as PerlinNoise1D.generate_noise, but generated
+with NumPy for many noise rows at once (requires NumPy to be installed).
+
+    noise = generate_noise_batch(1000, value_range=(-4, 4), repeatable=True)
+    noise.shape  # (1000, 128) - one row per noise, same as PerlinNoise1D.array()
+
+Instead of interpolating every layer element by element, each layer is
+interpolated for all rows and all positions with a few array operations.
+"""
+
+
+def generate_noise_batch(
+        count, width=None, weights=None, value_range=None,
+        decimal_places=6, repeatable=False, rng=None
+):
+    if width is None:
+        width = WIDTH
+    else:
+        assert isinstance(width, int), "Width has to be an integer"
+
+    if weights is None:
+        weights = WEIGHTS
+    else:
+        TEST_perlin_weights(width, weights)
+
+    if value_range is None:
+        value_range = VALUE_RANGE
+    else:
+        TEST_value_range(value_range)
+
+    # rng can be a numpy Generator, a seed or None (random seed)
+    if not isinstance(rng, np.random.Generator):
+        rng = np.random.default_rng(rng)
+
+    # The layers can only be interpolated on a width that is dividable
+    # by all weight keys -> interpolate them on the next larger width
+    # like that and only use the first (width + 1) values
+    layer_width = math.ceil(width / math.lcm(*weights)) * math.lcm(*weights)
+
+    random_array = rng.random((count, layer_width + 1))
+    noise_array = np.zeros((count, width + 1))
+    positions = np.arange(width + 1)
+
+    # Add the weighted noise for each layers described in weights
+    for sections_count in weights:
+        weight = weights[sections_count]
+        sections_width = int(layer_width/sections_count)
+
+        # Get noise array for this layer: Linear interpolation between
+        # the samples at every sections_width-th position
+        sample_array = random_array[:, 0:(sections_count * sections_width) + 1:sections_width]
+        left_indices = positions // sections_width
+        right_indices = np.minimum(left_indices + 1, sections_count)
+        right_factors = (positions % sections_width) / sections_width
+        interpolated_array = (
+            sample_array[:, left_indices] * (1 - right_factors) +
+            sample_array[:, right_indices] * right_factors
+        )
+
+        # Get noise layer to overall noise array
+        noise_array += interpolated_array * weight
+
+    if repeatable:
+        difference = noise_array[:, width - 1] - noise_array[:, 0]
+        corrector = np.round(
+            np.arange(width) * (difference[:, np.newaxis] / (width - 1)), decimal_places
+        )
+        noise_array = noise_array[:, :width] - corrector
+
+    # 1. Normalize array to (0, 1)
+    # 2. Scale array to actual size
+    # 3. Translate array to actual offset
+    max_values = noise_array.max(axis=1, keepdims=True)
+    min_values = noise_array.min(axis=1, keepdims=True)
+    normalizing_factors = (1/(max_values - min_values)) * (value_range[1] - value_range[0])
+    translation_offset = value_range[0]
+    noise_array = np.round(((noise_array - min_values) * normalizing_factors) + translation_offset, decimal_places)
+
+    return noise_array[:, :width]
+
+
+if __name__ == '__main__':
+    # Benchmark: One PerlinNoise1D instance per enemy (like v7.enemy
+    # does it) vs. all noise rows in one batched call
+    import random
+    import time
+    from engine_v2.perlin import PerlinNoise1D
+
+    for count in (10, 100, 1000, 10000):
+        start_time = time.perf_counter()
+        single_noises = np.array([
+            PerlinNoise1D(value_range=(-4, 4), repeatable=True).array()
+            for i in range(count)
+        ])
+        duration_single = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        batch_noises = generate_noise_batch(count, value_range=(-4, 4), repeatable=True)
+        duration_batch = time.perf_counter() - start_time
+
+        print(
+            f"{count:>6} noises: {duration_single * 1000:9.2f} ms (PerlinNoise1D) "
+            f"{duration_batch * 1000:7.2f} ms (batch) {duration_single / duration_batch:7.1f}x"
+        )
+
+    # Both variants have to produce the same distribution
+    for name, noises in (("PerlinNoise1D", single_noises), ("batch", batch_noises)):
+        steps = np.abs(np.diff(noises, axis=1))
+        print(
+            f"{name:>14}: mean={noises.mean():+.3f} std={noises.std():.3f} "
+            f"mean step={steps.mean():.4f} start-end={np.abs(noises[:, 0] - noises[:, -1]).mean():.4f}"
+        )
@@ -0,0 +1,86 @@
+
+import math
+
+# Constants
+from engine_v2.constants import *
+
+
+"""
+A uniform grid that sorts static game elements (e.g. barriers) into
+square cells of SPATIAL_GRID_CELL_SIZE meters.
+
+Instead of testing a moving object against every single barrier, we
+only have to test the barriers that share at least one cell with the
+moving object's bounding box. Since barriers never move, every barrier
+only has to be inserted once - right when it is created.
+
+The grid only narrows down the candidates. The actual collision check
+is still done by engine_v2.helpers.get_collision, therefore the
+collision results are exactly the same as without the grid.
+"""
+
+
+class SpatialGrid:
+
+    def __init__(self, cell_size=SPATIAL_GRID_CELL_SIZE):
+        assert cell_size > 0, "cell_size has to be greater than 0"
+
+        self.cell_size = cell_size
+
+        # {(column, row): [element, ...], ...}
+        self.cells = {}
+        self.count = 0
+
+    # Returns the range of cells covered by a rectangle with the given
+    # center position and size: ((first_column, last_column), (first_row, last_row))
+    def get_cell_range(self, position, size):
+        return tuple(
+            (
+                math.floor((position[dim] - size[dim]/2) / self.cell_size),
+                math.floor((position[dim] + size[dim]/2) / self.cell_size)
+            )
+            for dim in (0, 1)
+        )
+
+    def insert(self, element):
+        self.count += 1
+
+        (column_start, column_end), (row_start, row_end) = self.get_cell_range(element.position, element.size)
+        for column in range(column_start, column_end + 1):
+            for row in range(row_start, row_end + 1):
+                self.cells.setdefault((column, row), []).append(element)
+
+    def remove(self, element):
+        self.count -= 1
+
+        (column_start, column_end), (row_start, row_end) = self.get_cell_range(element.position, element.size)
+        for column in range(column_start, column_end + 1):
+            for row in range(row_start, row_end + 1):
+                cell = self.cells[(column, row)]
+                cell.remove(element)
+                if len(cell) == 0:
+                    del self.cells[(column, row)]
+
+    def clear(self):
+        self.cells = {}
+        self.count = 0
+
+    # Returns all elements that share at least one cell with the given
+    # rectangle. Every element is only returned once
+    def query(self, position, size):
+        (column_start, column_end), (row_start, row_end) = self.get_cell_range(position, size)
+
+        # Most moving objects are smaller than one cell -> shortcut
+        # without any deduplication
+        if column_start == column_end and row_start == row_end:
+            return self.cells.get((column_start, row_start), [])
+
+        candidates = set()
+        for column in range(column_start, column_end + 1):
+            for row in range(row_start, row_end + 1):
+                candidates.update(self.cells.get((column, row), ()))
+
+        return candidates
+
+    def __len__(self):
+        return self.count
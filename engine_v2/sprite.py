@@ -2,6 +2,7 @@ import pygame
 import os
 import sys
 import math
+from collections import OrderedDict
 
 from engine_v2.helpers import ends_with, is_number
 """
@@ -9,6 +10,29 @@ Die Funktionen getAnimationFromFolder und getAnimationFromSpritesheet
 geben eine Liste von pygame.image.load-Bildern zurueck. 
 """
 
+# Process-wide image caches shared by all Sprite instances. Every image
+# file is only decoded once and every animation frame only exists once
+# in memory, no matter how many sprites use it. The cached images must
+# never be modified (e.g. with blit or fill).
+#
+# spritesheet_cache = {spritesheet_path: image, ...}
+# animation_cache = {animation_key: ((image, ...), animation_key), ...}
+# transformed_image_cache = {(animation_key, image_index, size, scale, flip): image, ...}
+#
+# Every sprite can have its own size, so the transformed images are an
+# LRU cache (least recently used first) limited to
+# TRANSFORMED_IMAGE_CACHE_BUDGET bytes, like the text cache of Game
+spritesheet_cache = {}
+animation_cache = {}
+transformed_image_cache = OrderedDict()
+transformed_image_cache_bytes = 0
+TRANSFORMED_IMAGE_CACHE_BUDGET = 4 * 2**20
+
+
+def get_image_bytes(image):
+    return image.get_width() * image.get_height() * image.get_bytesize()
+
+
 def get_animation_from_directory(directory_path):
 
     assert \
@@ -54,7 +78,9 @@ def get_animation_from_spritesheet(
         "Parameter number_of_images too large for " \
         "specified row_count and column_count"
 
-    spritesheet = pygame.image.load(spritesheet_path)
+    if spritesheet_path not in spritesheet_cache:
+        spritesheet_cache[spritesheet_path] = pygame.image.load(spritesheet_path)
+    spritesheet = spritesheet_cache[spritesheet_path]
     spritesheet_size = spritesheet.get_size()
     sprite_size = [
         round(spritesheet_size[0]/column_count),
@@ -75,7 +101,10 @@ def get_animation_from_spritesheet(
         # Generate the single sprite by cropping with (x, y, w, h)
         single_sprite = pygame.Surface(sprite_size)
         single_sprite.blit(spritesheet, (0, 0), (x, y, w, h))
-        single_sprite = single_sprite.convert()
+
+        # Converting needs a display (there is none in headless mode)
+        if pygame.display.get_surface() is not None:
+            single_sprite = single_sprite.convert()
         single_sprite.set_colorkey(single_sprite.get_at((0, 0)), pygame.RLEACCEL)
 
         animation_images.append(single_sprite)
@@ -88,6 +117,25 @@ def get_animation_from_spritesheet(
     return animation_images
 
 
+# Returns the (cached) animation frames and the key under which they
+# are stored in animation_cache. The key is cached as well, so all
+# sprites of one animation share the same key object
+def get_cached_animation(directory_path=None, spritesheet_path=None, **kwargs):
+    if directory_path is not None:
+        animation_key = ("directory", directory_path)
+    else:
+        animation_key = ("spritesheet", spritesheet_path, tuple(sorted(kwargs.items())))
+
+    if animation_key not in animation_cache:
+        if directory_path is not None:
+            images = get_animation_from_directory(directory_path)
+        else:
+            images = get_animation_from_spritesheet(spritesheet_path, **kwargs)
+        animation_cache[animation_key] = (tuple(images), animation_key)
+
+    return animation_cache[animation_key]
+
+
 class Sprite(pygame.sprite.Sprite):
 
     # properties = horizontalSprites, verticalSprites, horizontalStart, verticalStart, numberOfImages
@@ -101,10 +149,9 @@ class Sprite(pygame.sprite.Sprite):
             isinstance(spritesheet_path, str) and directory_path is None, \
             "Exactly one of directory_path or spritesheet_path has to be set as a string"
 
-        if directory_path is not None:
-            self.images = get_animation_from_directory(directory_path)
-        else:
-            self.images = get_animation_from_spritesheet(spritesheet_path, **kwargs)
+        # The frames are shared with all other sprites using the same
+        # animation, a sprite only stores its animation state
+        self.images, self.animation_key = get_cached_animation(directory_path, spritesheet_path, **kwargs)
 
         self.fps = fps
         assert is_number(fps) and fps > 0, "fps has to be a number greater that 0"
@@ -118,6 +165,16 @@ class Sprite(pygame.sprite.Sprite):
         self.index = 0
         self.counter = 0
 
+    @property
+    def size(self):
+        return self._size
+
+    # The size is stored in whole pixels, since it is part of the
+    # key in transformed_image_cache
+    @size.setter
+    def size(self, size):
+        self._size = None if size is None else tuple(round(s) for s in size)
+
     def update(self, timedelta, fps=None):
         if fps is None:
             fps = self.fps
@@ -128,17 +185,38 @@ class Sprite(pygame.sprite.Sprite):
         self.index = 0
 
     def getImage(self):
-        image = self.images[math.floor(self.index)]
+        global transformed_image_cache_bytes
+        image_index = math.floor(self.index)
+        flip = (bool(self.flip[0]), bool(self.flip[1]))
+
+        # Scaling and flipping creates new images, so we only do that
+        # once for every image, size/scale and flip direction
+        key = (self.animation_key, image_index, self.size, self.scale, flip)
+        if key in transformed_image_cache:
+            transformed_image_cache.move_to_end(key)
+        else:
+            image = self.images[image_index]
+
+            if self.size is not None:
+                image = pygame.transform.scale(image, self.size)
+            elif self.scale is not None:
+                sprite_size = image.get_rect()[2:]
+                new_size = [round(s) for s in (sprite_size[0] * self.scale, sprite_size[1] * self.scale)]
+                image = pygame.transform.scale(image, new_size)
 
-        if self.size is not None:
-            new_size = [round(s) for s in self.size]
-            image = pygame.transform.scale(image, new_size)
-        elif self.scale is not None:
-            sprite_size = image.get_rect()[2:]
-            new_size = [round(s) for s in (sprite_size[0] * self.scale, sprite_size[1] * self.scale)]
-            image = pygame.transform.scale(image, new_size)
+            image = pygame.transform.flip(image, flip[0], flip[1])
+            transformed_image_cache[key] = image
+            transformed_image_cache_bytes += get_image_bytes(image)
 
-        return pygame.transform.flip(image, self.flip[0], self.flip[1])
+            # Remove the least recently used images when over budget
+            while (
+                    transformed_image_cache_bytes > TRANSFORMED_IMAGE_CACHE_BUDGET and
+                    len(transformed_image_cache) > 1
+            ):
+                _, old_image = transformed_image_cache.popitem(last=False)
+                transformed_image_cache_bytes -= get_image_bytes(old_image)
+
+        return transformed_image_cache[key]
 
 
 if __name__ == '__main__':
@@ -147,6 +225,51 @@ if __name__ == '__main__':
     pygame.display.set_caption("Animation Beispiel")
     clock = pygame.time.Clock()
 
+    # Benchmark: Creating 1000 enemy sprites with and without the shared
+    # image caches (resident memory read from /proc, Linux only)
+    import time
+
+    def get_resident_memory():
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    for shared_cache in (False, True):
+        memory_before = get_resident_memory()
+        start_time = time.perf_counter()
+        enemy_sprites = []
+        for i in range(1000):
+            if not shared_cache:
+                spritesheet_cache.clear()
+                animation_cache.clear()
+            enemy_sprites.append(Sprite(
+                spritesheet_path="../assets/dungeon_spritesheets/enemy_spritesheet@8x.png",
+                row_count=1, column_count=5, number_of_images=4, size=(31.5, 38.25)
+            ))
+        duration = time.perf_counter() - start_time
+        memory = get_resident_memory() - memory_before
+        print(
+            f"shared_cache={shared_cache}: 1000 sprites loaded in {duration * 1000:.1f} ms, "
+            f"+{memory / 2**20:.1f} MiB resident memory"
+        )
+        del enemy_sprites
+
+    # Test: Growing a sprite through 200 sizes keeps the transformed
+    # images within TRANSFORMED_IMAGE_CACHE_BUDGET, the last one is kept
+    growing_sprite = Sprite(
+        spritesheet_path="../assets/dungeon_spritesheets/enemy_spritesheet@8x.png",
+        row_count=1, column_count=5, number_of_images=4, size=(10, 10)
+    )
+    for i in range(200):
+        growing_sprite.size = (10 + i, 10 + i)
+        image = growing_sprite.getImage()
+    assert transformed_image_cache_bytes == sum(map(get_image_bytes, transformed_image_cache.values()))
+    assert transformed_image_cache_bytes <= TRANSFORMED_IMAGE_CACHE_BUDGET or len(transformed_image_cache) == 1
+    assert next(reversed(transformed_image_cache.values())) is image
+    print(
+        f"200 sizes: {len(transformed_image_cache)} images cached, "
+        f"{transformed_image_cache_bytes / 2**20:.1f} MiB"
+    )
+
     sprite_1 = Sprite(
         spritesheet_path="../assets/example_characters/pumpkin_dude.png",
         fps=12, scale=3, flip=(False, False),
@@ -0,0 +1,154 @@
+
+import bisect
+
+
+"""
+A sort-and-sweep broadphase for moving game elements (e.g. enemies
+and players).
+
+All elements are kept sorted by the x-coordinate of their left edge.
+A rectangle can then only overlap the elements whose left edge lies
+between (rectangle_left - widest_element) and rectangle_right, which
+we find with a binary search instead of testing every element.
+
+Since the elements only move a tiny bit between two simulation frames
+the list stays almost sorted. Python's sort (timsort) detects these
+already sorted runs, so re-sorting once per frame costs about O(n).
+
+The broadphase only narrows down the candidates. The actual collision
+check is still done by engine_v2.helpers.get_collision.
+"""
+
+# Padding (in meter) for all queries, so that rounding errors in the
+# left-edge keys never hide an actual collision
+QUERY_MARGIN = 1e-6
+
+
+class SweepAndPrune:
+
+    def __init__(self):
+        # Both lists are sorted by the left edge of the elements
+        self.elements = []
+        self.keys = []
+
+        # The widest element ever inserted
+        self.max_width = 0
+
+        # Candidates are returned in insertion order, which is the same
+        # order as the plain instance-lists
+        self.insertion_order = {}
+        self.insertion_counter = 0
+
+    @staticmethod
+    def get_key(element):
+        return element.position[0] - element.size[0]/2
+
+    def insert(self, element):
+        self.insertion_order[element] = self.insertion_counter
+        self.insertion_counter += 1
+        self.max_width = max(self.max_width, element.size[0])
+
+        key = SweepAndPrune.get_key(element)
+        index = bisect.bisect_right(self.keys, key)
+        self.keys.insert(index, key)
+        self.elements.insert(index, element)
+
+    def remove(self, element):
+        index = self.elements.index(element)
+        del self.keys[index]
+        del self.elements[index]
+        del self.insertion_order[element]
+
+    # Re-sort a single element after it has been moved
+    def move(self, element):
+        index = self.elements.index(element)
+        key = SweepAndPrune.get_key(element)
+
+        # Only touch the lists if the element is out of order now
+        if (
+            (index > 0 and self.keys[index - 1] > key) or
+            (index < len(self.keys) - 1 and self.keys[index + 1] < key)
+        ):
+            del self.keys[index]
+            del self.elements[index]
+            index = bisect.bisect_right(self.keys, key)
+            self.keys.insert(index, key)
+            self.elements.insert(index, element)
+        else:
+            self.keys[index] = key
+
+    # Re-sort all elements after all of them have been moved
+    def update(self):
+        keys = [SweepAndPrune.get_key(element) for element in self.elements]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.elements = [self.elements[i] for i in order]
+
+    # Returns all elements whose x-range overlaps the x-range of the
+    # rectangle with the given center position and size
+    def query(self, position, size):
+        left = position[0] - size[0]/2 - QUERY_MARGIN
+        right = position[0] + size[0]/2 + QUERY_MARGIN
+
+        start_index = bisect.bisect_left(self.keys, left - self.max_width)
+        end_index = bisect.bisect_right(self.keys, right)
+
+        candidates = [
+            self.elements[i] for i in range(start_index, end_index)
+            if self.keys[i] + self.elements[i].size[0] >= left
+        ]
+        if len(candidates) > 1:
+            candidates.sort(key=self.insertion_order.__getitem__)
+        return candidates
+
+    def __len__(self):
+        return len(self.elements)
+
+
+if __name__ == '__main__':
+    # Benchmark: How many narrowphase pair tests (get_collision calls) are
+    # needed per frame with and without the broadphase for enemies moving
+    # on a level and players fighting them
+    import random
+    import time
+
+    class MovingObject:
+        def __init__(self, position, size):
+            self.position = position
+            self.size = size
+            self.velocity = [random.uniform(-4, 4), 0.0]
+
+    random.seed(0)
+    frames = 100
+    timedelta = 1/300
+
+    print(f"{'enemies':>8} {'players':>8} {'tests without':>15} {'tests with':>12} {'broadphase time':>16}")
+    for enemy_count, player_count in ((10, 2), (100, 8), (500, 16), (1000, 32), (5000, 64)):
+        level_width = enemy_count * 0.5
+        enemies = [MovingObject([random.uniform(0, level_width), 1.625], [1.05, 1.275]) for i in range(enemy_count)]
+        players = [MovingObject([random.uniform(0, level_width), 1.8], [1.0, 1.6]) for i in range(player_count)]
+
+        enemy_sweep, player_sweep = SweepAndPrune(), SweepAndPrune()
+        for enemy in enemies:
+            enemy_sweep.insert(enemy)
+        for player in players:
+            player_sweep.insert(player)
+
+        tests_with_broadphase = 0
+        start_time = time.perf_counter()
+        for frame in range(frames):
+            for element in enemies + players:
+                element.position[0] += element.velocity[0] * timedelta
+            enemy_sweep.update()
+
+            for player in players:
+                player_sweep.move(player)
+                tests_with_broadphase += len(enemy_sweep.query(player.position, player.size))
+                tests_with_broadphase += len(player_sweep.query(player.position, player.size)) - 1
+        duration = (time.perf_counter() - start_time) / frames
+
+        tests_without_broadphase = player_count * enemy_count + player_count * (player_count - 1)
+        print(
+            f"{enemy_count:>8} {player_count:>8} {tests_without_broadphase:>15} "
+            f"{tests_with_broadphase / frames:>12.1f} {duration * 1e6:>13.1f} us"
+        )
@@ -95,11 +95,9 @@ def TEST_value_range(value_range):
     assert value_range[1] > value_range[0], "value_range invalid: min >= max"
 
 def TEST_perlin_weights(width, weights):
+    assert isinstance(width, int) and width > 1, "The width has to be an integer greater than 1"
     assert isinstance(weights, dict), "Weights has to be a dictionary"
-    assert all([isinstance(w, int) for w in weights]), "All weight keys must be integers"
-    assert all([is_number(w) for w in weights]), "All weight keys must be numbers"
-    assert all(
-        [int(width/key) == (width/key) for key in weights]
-    ), "The width must be dividable by all weight keys"
+    assert all([isinstance(w, int) and w > 0 for w in weights]), "All weight keys must be positive integers"
+    assert all([is_number(weights[w]) for w in weights]), "All weights must be numbers"
 
 
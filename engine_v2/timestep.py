@@ -0,0 +1,87 @@
+
+import math
+
+# Constants
+from engine_v2.constants import *
+
+
+"""
+A fixed-timestep accumulator that decouples the simulation from the
+drawing.
+
+The simulation always advances in steps of exactly 1/hz seconds, no
+matter how fast the game is being drawn. After each drawn frame we add
+the time that actually passed to the accumulator and run as many fixed
+steps as fit into it. The remainder is kept for the next frame.
+
+Usage:
+    timestep = FixedTimestep(hz=300)
+    while True:
+        for i in range(timestep.advance(frame_time)):
+            update(timestep.timedelta)
+        draw(alpha=timestep.alpha)
+
+Since the drawing happens somewhere between two simulation steps, the
+moving objects are drawn at interpolate(previous_position, position,
+timestep.alpha) - otherwise the movement would look jerky.
+
+When a frame took so long that more than max_steps_per_frame steps are
+due, only max_steps_per_frame steps are run. Up to max_backlog_steps of
+the remaining steps are caught up during the following frames, the
+time of all others is dropped (the game then runs in slow motion for a
+moment) instead of piling up more and more steps.
+"""
+
+
+class FixedTimestep:
+
+    def __init__(
+            self, hz=PHYSICS_HZ,
+            max_steps_per_frame=MAX_PHYSICS_STEPS_PER_DRAW,
+            max_backlog_steps=None
+    ):
+        assert hz > 0, "hz has to be greater than 0"
+        assert max_steps_per_frame >= 1, "max_steps_per_frame has to be at least 1"
+
+        if max_backlog_steps is None:
+            max_backlog_steps = max_steps_per_frame
+
+        self.hz = hz
+        self.timedelta = 1/hz
+        self.max_steps_per_frame = max_steps_per_frame
+        self.max_backlog_steps = max_backlog_steps
+
+        self.accumulator = 0.0
+
+        # Statistics
+        self.steps = 0
+        self.dropped_steps = 0
+        self.caught_up_steps = 0
+
+    # Adds the time that passed since the last frame and returns the
+    # number of simulation steps that have to be run now
+    def advance(self, frame_time):
+        self.accumulator += frame_time
+        steps = math.floor(self.accumulator / self.timedelta)
+
+        # Keep the remainder (< 1 step) for the next frame
+        self.accumulator = max(self.accumulator - steps * self.timedelta, 0.0)
+
+        if steps > self.max_steps_per_frame:
+            # Keep some of the steps that are too many for later
+            backlog_steps = min(steps - self.max_steps_per_frame, self.max_backlog_steps)
+            self.dropped_steps += steps - self.max_steps_per_frame - backlog_steps
+            self.accumulator += backlog_steps * self.timedelta
+            steps = self.max_steps_per_frame
+
+        # Steps beyond the time of this frame (plus the remainder of less
+        # than one step) are the ones left over from earlier frames
+        self.caught_up_steps += max(0, steps - math.ceil(frame_time / self.timedelta))
+        self.steps += steps
+        return steps
+
+    # How far the drawing is between the last and the next simulation
+    # step (0 = last step, 1 = next step)
+    @property
+    def alpha(self):
+        return self.accumulator / self.timedelta
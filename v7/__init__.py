@@ -1,2 +1,8 @@
 
-from v7.main import run
+
+# v7.main is only imported when the game is started, so importing the
+# package does not import all of its modules. Otherwise running a single
+# module (e.g. "python -m v7.world") would import that module twice
+def run(*args, **kwargs):
+    from v7.main import run
+    return run(*args, **kwargs)
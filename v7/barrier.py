@@ -3,7 +3,9 @@ import random
 
 # Engine
 from engine_v2.sprite import Sprite
-from engine_v2.helpers import is_number, merge_into_list_dict, reduce_to_relevant_collisions, get_collision
+from engine_v2.helpers import is_number, merge_into_list_dict, reduce_to_relevant_collisions, get_collision, \
+    get_swept_collision, CollisionRecord
+from engine_v2.spatial_grid import SpatialGrid
 from engine_v2.tests import TEST_mandatory_coordinates
 
 # Constants
@@ -12,11 +14,12 @@ from engine_v2.constants import *
 
 class Barrier:
 
-    # A list of all SquareBarrier instances
-    instances = []
+    # No per-instance __dict__ (there can be many thousand barriers)
+    __slots__ = ("world", "position", "size", "color")
 
+    # world is the World (v7/world.py) this barrier belongs to
     def __init__(
-            self,
+            self, world,
             x_left=None, x_center=None,
             y_top=None, y_center=None,
             width=1, height=1,
@@ -34,35 +37,271 @@ class Barrier:
         self.size = [width, height]
         self.color = color
 
-        # Add this new instances to the instance-list from above
-        Barrier.instances.append(self)
+        # Add this new instances to the barrier-list and grid of its world
+        self.world = world
+        world.barriers.append(self)
+        world.barrier_grid.insert(self)
+        world.barrier_version += 1
 
     # Draw a single SquareBarrier instances
     def draw(self, game):
         game.draw_rect_element(self.position, self.size, color=self.color)
 
-    # Draw all SquareBarrier instances
+    # Draw all SquareBarrier instances of a world
     @staticmethod
-    def draw_all(game):
-        for barrier in Barrier.instances:
+    def draw_all(world, game):
+        for barrier in world.barriers:
             barrier.draw(game)
 
+    # Merges all barriers with the same color that touch (or overlap)
+    # each other edge to edge into larger rectangles. Example: Three 1x1
+    # blocks next to each other become one 3x1 block, two 3x1 blocks on
+    # top of each other become one 3x2 block. Fewer barriers = fewer
+    # collision checks and fewer draw calls.
+    #
+    # Call this once after all barriers of a level have been created.
+    # Returns the number of barriers that have been removed
     @staticmethod
-    def detect_all_collisions(player):
-        # 1. Fetch all possiple collisions
-        all_collisions = {
-            'FLOOR': [],
-            'CEILING': [],
-            'LEFT_WALL': [],
-            'RIGHT_WALL': [],
-        }
-        for barrier in Barrier.instances:
-            all_collisions = merge_into_list_dict(
-                all_collisions,
-                get_collision(barrier=barrier, moving_object=player)
+    def coalesce_all(world):
+        barrier_count = len(world.barriers)
+
+        def get_edges(barrier, dim):
+            return (
+                round(barrier.position[dim] - barrier.size[dim]/2, 9),
+                round(barrier.position[dim] + barrier.size[dim]/2, 9)
             )
 
-        # 2. Reduce all collisions to the relevant ones, example:
-        #    all_collisions['FLOOR'] = [3.0, 4.2, 2.2, 4.0]
-        #    -> relevant_collisions['FLOOR'] = 4.2
+        # The merged barriers keep the (drawing) order of the first
+        # barrier they contain
+        barriers = list(world.barriers)
+        first_index = {id(barrier): i for i, barrier in enumerate(barriers)}
+        merged = True
+        while merged:
+            merged = False
+
+            # First merge along the x-axis (dim=0), then along the y-axis
+            for dim in (0, 1):
+                other_dim = 1 - dim
+
+                # Only barriers with the same color and the same edges on
+                # the other axis can be merged -> these are sorted next to
+                # each other
+                barriers.sort(key=lambda b: (tuple(b.color), get_edges(b, other_dim), get_edges(b, dim)))
+
+                merged_barriers = []
+                for barrier in barriers:
+                    if len(merged_barriers) > 0:
+                        last_barrier = merged_barriers[-1]
+                        last_min, last_max = get_edges(last_barrier, dim)
+                        new_min, new_max = get_edges(barrier, dim)
+                        if (
+                            tuple(last_barrier.color) == tuple(barrier.color) and
+                            get_edges(last_barrier, other_dim) == get_edges(barrier, other_dim) and
+                            new_min <= last_max
+                        ):
+                            new_max = max(last_max, new_max)
+                            last_barrier.position[dim] = (last_min + new_max) / 2
+                            last_barrier.size[dim] = new_max - last_min
+                            first_index[id(last_barrier)] = min(
+                                first_index[id(last_barrier)], first_index[id(barrier)]
+                            )
+                            merged = True
+                            continue
+                    merged_barriers.append(barrier)
+
+                barriers = merged_barriers
+
+        # Replace all barriers with the merged ones
+        barriers.sort(key=lambda b: first_index[id(b)])
+        world.barriers[:] = barriers
+        world.barrier_grid = SpatialGrid(world.barrier_grid.cell_size)
+        for barrier in world.barriers:
+            world.barrier_grid.insert(barrier)
+        world.barrier_version += 1
+
+        return barrier_count - len(world.barriers)
+
+    # start_position is the position of the player before the current
+    # step. When it is given, all barriers between start_position and
+    # the current position will be detected as well
+    #
+    # The collisions are added to record (a CollisionRecord), which only
+    # keeps the relevant ones, example: FLOOR collisions at 3.0, 4.2 and
+    # 2.2 -> record['FLOOR'] = 4.2
+    @staticmethod
+    def detect_all_collisions(player, start_position=None, record=None):
+        if record is None:
+            record = CollisionRecord()
+
+        if start_position is None:
+            # Only the barriers sharing a grid cell with the player can collide
+            for barrier in player.world.barrier_grid.query(player.position, player.size):
+                get_collision(barrier=barrier, moving_object=player, record=record)
+        else:
+            # Only the barriers sharing a grid cell with the area the
+            # player has swept through can collide
+            swept_position = [(player.position[dim] + start_position[dim])/2 for dim in (0, 1)]
+            swept_size = [player.size[dim] + abs(player.position[dim] - start_position[dim]) for dim in (0, 1)]
+            for barrier in player.world.barrier_grid.query(swept_position, swept_size):
+                record.update(
+                    get_swept_collision(barrier=barrier, moving_object=player, start_position=start_position)
+                )
+
+        return record
+
+
+if __name__ == '__main__':
+    # Benchmark: Collision detection with the grid vs. testing every
+    # single barrier. The results have to be exactly the same
+    import time
+    from v7.world import World
+
+    class MovingObject:
+        def __init__(self, world, position):
+            self.world = world
+            self.position = position
+            self.size = [1.0, 1.6]
+            self.velocity = [0.0, 0.0]
+
+    def detect_all_collisions_without_grid(player):
+        all_collisions = {'FLOOR': [], 'CEILING': [], 'LEFT_WALL': [], 'RIGHT_WALL': []}
+        for barrier in player.world.barriers:
+            all_collisions = merge_into_list_dict(all_collisions, get_collision(barrier=barrier, moving_object=player))
         return reduce_to_relevant_collisions(all_collisions)
+
+    random.seed(0)
+    print(f"{'barriers':>10} {'without grid':>15} {'with grid':>15} {'speedup':>10}")
+
+    for barrier_count in (10, 100, 1000, 10000, 100000):
+        world = World()
+
+        # Scatter the barriers over an area that grows with the barrier count
+        # so that the barrier density stays the same as in the regular level
+        area_width = (barrier_count * 50) ** 0.5
+        for i in range(barrier_count):
+            Barrier(
+                world, x_left=random.uniform(0, area_width), y_top=random.uniform(0, area_width),
+                width=random.choice((1, 2, 5)), height=random.choice((1, 2))
+            )
+        players = [
+            MovingObject(world, [random.uniform(0, area_width), random.uniform(0, area_width)])
+            for i in range(50)
+        ]
+
+        # Without grid (only a subset of the queries for the large maps)
+        query_count = 50 if barrier_count <= 10000 else 5
+        start_time = time.perf_counter()
+        expected = [detect_all_collisions_without_grid(p) for p in players[:query_count]]
+        duration_without_grid = (time.perf_counter() - start_time) / query_count
+
+        start_time = time.perf_counter()
+        results = [Barrier.detect_all_collisions(p) for p in players]
+        duration_with_grid = (time.perf_counter() - start_time) / len(players)
+
+        assert \
+            [result.as_dict() for result in results[:query_count]] == expected, \
+            "Grid results differ from the plain results"
+
+        print(
+            f"{barrier_count:>10} {duration_without_grid * 1e6:>12.1f} us {duration_with_grid * 1e6:>12.1f} us "
+            f"{duration_without_grid / duration_with_grid:>9.1f}x"
+        )
+
+    # Test: Merging a level of 1x1 tiles (a floor with a wall of stacked
+    # tiles at its end) results in exactly the level built from the two
+    # large rectangles: same barriers, same collisions, same movement.
+    #
+    # Compared to the tile level the results DO change on purpose: The
+    # player overlaps the floor (or wall) by ERROR_MARGIN. When it reaches
+    # into the next tile by less than a third of that, get_collision
+    # classifies that tile as a wall (or a floor). These seam collisions
+    # are gone after merging, so the player is not stopped at the seams
+    # anymore (see 1. and 2. below)
+    def build_level(kind):
+        world = World()
+        if kind == "rectangles":
+            Barrier(world, x_left=0, y_top=1, width=40, height=1)
+            Barrier(world, x_left=40, y_top=11, width=1, height=10)
+            return world
+
+        for x in range(40):
+            Barrier(world, x_left=x, y_top=1, width=1, height=1)
+        for y in range(2, 12):
+            Barrier(world, x_left=40, y_top=y, width=1, height=1)
+        if kind == "merged":
+            removed_count = Barrier.coalesce_all(world)
+            assert removed_count == 48 and len(world.barriers) == 2, "Expected one floor and one wall"
+        return world
+
+    tile_world, merged_world, rectangle_world = build_level("tiles"), build_level("merged"), build_level("rectangles")
+    assert \
+        [(b.position, b.size) for b in merged_world.barriers] == \
+        [(b.position, b.size) for b in rectangle_world.barriers], \
+        "Expected the merged tiles to be the two rectangles"
+
+    def detect(world, position):
+        return Barrier.detect_all_collisions(MovingObject(world, list(position))).as_dict()
+
+    # Snap to floors and walls like Player.update_for_collisions
+    def snap(collisions, position, velocity):
+        position, velocity = list(position), list(velocity)
+        if collisions['FLOOR'] is not None and velocity[1] < ERROR_MARGIN:
+            velocity[1] = 0
+            position[1] = collisions['FLOOR'] + 0.8 - ERROR_MARGIN
+        if collisions['RIGHT_WALL'] is not None and velocity[0] > -ERROR_MARGIN:
+            velocity[0] = 0
+            position[0] = collisions['RIGHT_WALL'] - 0.5 + ERROR_MARGIN
+        return position, velocity
+
+    # Moves through a level, returns the position, velocity and collisions
+    # of every step
+    def simulate(world, position, velocity, run_velocity, steps):
+        trace = []
+        for step in range(steps):
+            velocity = [run_velocity, velocity[1] - GRAVITY / 300]
+            position = [position[dim] + velocity[dim] / 300 for dim in (0, 1)]
+            collisions = detect(world, position)
+            position, velocity = snap(collisions, position, velocity)
+            trace.append((position, velocity, collisions))
+        return trace
+
+    standing_y = 1 + 0.8 - ERROR_MARGIN
+    wall_x = 40 - 0.5 + ERROR_MARGIN
+
+    # 1. Walking along the floor until stopping at the wall (same start
+    #    position as the players in v7.main). With tiles the player is
+    #    stopped by a seam collision before reaching the wall
+    walk = [simulate(world, (14.5, standing_y), (0, 0), RUN_VELOCITY, 1200) for world in (merged_world, tile_world)]
+    assert walk[0] == simulate(rectangle_world, (14.5, standing_y), (0, 0), RUN_VELOCITY, 1200), "Walking differs"
+    merged_stops = [position[0] for position, velocity, collisions in walk[0] if velocity[0] == 0]
+    tile_stops = [position[0] for position, velocity, collisions in walk[1] if velocity[0] == 0]
+    assert set(merged_stops) == {wall_x}, "Expected the player to only stop at the wall"
+    assert tile_stops[0] == 17 - 0.5 + ERROR_MARGIN, "Expected the seam at x=17 to stop the player on tiles"
+    assert walk[0][-1][0] == walk[1][-1][0] == [wall_x, standing_y], "Expected the player to stop at the wall"
+    print(f"Walking 1200 steps along the floor: stopped at {sorted(set(tile_stops))} on tiles, only at the wall merged")
+
+    # 2. Sliding down along the wall. With tiles the player gets caught
+    #    on the seam at y=9 and stands on the wall
+    slide = [simulate(world, (wall_x, 10), (0, 0), 0, 300) for world in (merged_world, tile_world)]
+    assert slide[0] == simulate(rectangle_world, (wall_x, 10), (0, 0), 0, 300), "Sliding differs"
+    assert slide[0][-1][0] == [wall_x, standing_y], "Expected the player to land on the floor"
+    assert slide[1][-1][0] == [wall_x, 9 + 0.8 - ERROR_MARGIN], "Expected the player to be caught on tiles"
+    print("Sliding 300 steps down the wall: caught on the seam at y=9 on tiles, landed on the floor merged")
+
+    # 3. Every single position along the floor and along the wall: The
+    #    merged level has exactly the collisions of the rectangles.
+    #    Merging only removes collisions (the seam collisions), it never
+    #    adds or moves one
+    for name, positions in (
+        ("floor", [(x / 1000, standing_y) for x in range(1000, 39000)]),
+        ("wall", [(wall_x, y / 1000) for y in range(2000, 11000)]),
+    ):
+        removed_count = 0
+        for position in positions:
+            tile_collisions, merged_collisions = detect(tile_world, position), detect(merged_world, position)
+            assert merged_collisions == detect(rectangle_world, position), f"Collisions differ at {position}"
+            for side in merged_collisions:
+                if merged_collisions[side] != tile_collisions[side]:
+                    assert merged_collisions[side] is None, f"{side} has been added or moved at {position}"
+                    removed_count += 1
+        print(f"{len(positions)} positions along the {name}: {removed_count} seam collisions removed by merging")
@@ -0,0 +1,132 @@
+
+# Libraries
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Constants
+from engine_v2.constants import *
+
+# Components
+from v7.headless import ScriptedInput, run_headless
+
+
+"""
+Runs many independent headless matches (see v7/headless.py) on all
+cores at once, e.g. for tuning the difficulty of a level:
+
+    run_batch(range(1000), "results.jsonl", max_seconds=60)
+
+Every match is identified by its seed. The seed is used for the random
+bot input and for all the randomness inside the game (the perlin noise
+of the enemies), so the same seed always leads to the same match.
+
+The results are written to the sink (.jsonl or .csv) as soon as a match
+has finished, one line per match. Matches do not share any state, so
+the throughput grows almost linearly with the number of processes.
+
+Run "python -m v7.batch" for a benchmark.
+"""
+
+
+# The columns of the csv sink (nested results are flattened)
+CSV_FIELDS = (
+    "seed", "steps", "simulated_seconds", "finished", "finish_step", "finish_seconds", "duration",
+    "player_1_name", "player_1_score", "player_1_lifes_left", "player_1_enemies_killed",
+    "player_2_name", "player_2_score", "player_2_lifes_left", "player_2_enemies_killed",
+    "sorted_scores"
+)
+
+
+# Simulates a single match with random bot input. This is the function
+# running inside the worker processes, so it has to be importable and
+# all arguments/results have to be picklable
+def run_match(seed, max_seconds=60):
+    max_steps = round(max_seconds * PHYSICS_HZ)
+    stats = run_headless(ScriptedInput.random(max_steps, seed=seed), max_steps=max_steps, seed=seed)
+
+    # The results of a seed should always be the same, but the duration
+    # and steps_per_second are wall clock measurements (like the
+    # game_finish_time from check_for_win, which is not part of the
+    # results). When the match was finished is given in simulated time
+    del stats["steps_per_second"]
+    stats["finish_step"] = stats["steps"] if stats["finished"] else None
+    stats["finish_seconds"] = stats["simulated_seconds"] if stats["finished"] else None
+    stats["seed"] = seed
+    return stats
+
+
+class ResultSink:
+
+    # Writes one match per line to a .jsonl or .csv file
+    def __init__(self, path):
+        assert os.path.splitext(path)[1] in (".jsonl", ".csv"), "The sink has to be a .jsonl or .csv file"
+        self.path = path
+        self.file = open(path, "w", newline="")
+
+        self.csv_writer = None
+        if path.endswith(".csv"):
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDS)
+            self.csv_writer.writeheader()
+
+    def write(self, stats):
+        if self.csv_writer is None:
+            self.file.write(json.dumps(stats) + "\n")
+        else:
+            row = {key: stats[key] for key in CSV_FIELDS if key in stats}
+            for i, player in enumerate(stats["players"]):
+                for key in ("name", "score", "lifes_left", "enemies_killed"):
+                    row[f"player_{i + 1}_{key}"] = player[key]
+            row["sorted_scores"] = json.dumps(stats["sorted_scores"])
+            self.csv_writer.writerow(row)
+
+        # Finished matches should not get lost when the batch is aborted
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# Runs one match per seed on processes worker processes (None = one per
+# core) and streams the results into the sink at sink_path in the order
+# the matches finish. Returns the number of matches
+def run_batch(seeds, sink_path, max_seconds=60, processes=None):
+    sink = ResultSink(sink_path)
+    match_count = 0
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(run_match, seed, max_seconds) for seed in seeds]
+            for future in as_completed(futures):
+                sink.write(future.result())
+                match_count += 1
+    finally:
+        sink.close()
+    return match_count
+
+
+if __name__ == '__main__':
+    # Benchmark: Matches per second with 1 process vs. one process per
+    # core (at least 2). Both runs have to produce exactly the same results
+    import tempfile
+
+    seeds = range(16)
+    max_seconds = 10
+    results = {}
+
+    for processes in sorted({1, max(2, os.cpu_count() or 1)}):
+        sink_path = os.path.join(tempfile.gettempdir(), f"v7_batch_{processes}.jsonl")
+        start_time = time.perf_counter()
+        match_count = run_batch(seeds, sink_path, max_seconds=max_seconds, processes=processes)
+        duration = time.perf_counter() - start_time
+        print(f"{processes:>3} processes: {match_count / duration:6.2f} matches/s ({match_count} matches in {duration:.1f} s)")
+
+        with open(sink_path) as f:
+            matches = [json.loads(line) for line in f]
+        results[processes] = sorted(
+            [(match["seed"], match["steps"], match["finish_step"], match["players"]) for match in matches],
+            key=lambda match: match[0]
+        )
+
+    assert len(set(json.dumps(result) for result in results.values())) == 1, "Results depend on the number of processes"
@@ -0,0 +1,313 @@
+# Libraries
+import io
+
+# Constants
+from engine_v2.constants import *
+
+# Components
+from v7.replay import read_varint, write_varint
+
+
+"""
+A compact wire format for the state of a world (e.g. for network play or
+spectators): Every state only contains what has changed since the last
+state the receiver has acknowledged (the baseline).
+
+    encoder = DeltaEncoder()               # server, one per client
+    data = encoder.encode(world, tick)
+    ...                                    # send data, receive ack
+    encoder.ack(sequence)
+
+    decoder = DeltaDecoder()               # client
+    sequence = decoder.decode(data)        # -> send back as ack
+    decoder.players, decoder.enemies
+
+All values are integers: coordinates and velocities are quantized to
+COORDINATE_PRECISION decimal places (which is the precision they are
+stored with anyway, so nothing is lost), scores to 2 decimal places.
+
+    state:   varint sequence, varint baseline sequence (0 = none), varint tick
+             players section, enemies section
+    section: varint changed count, changed objects,
+             varint removed count, removed ids (ascending, delta coded)
+    object:  varint id, field mask (1 byte), one zigzag varint per changed
+             field (the difference to the baseline value)
+
+Enemies that have been killed (Enemy.kill) are in the removed ids, new
+enemies are encoded as a difference to all zeros. Swarm enemies (see
+v7/enemy_swarm.py) are encoded exactly like Enemy objects.
+
+Since the baseline is always a state the receiver knows, any state may
+be lost (e.g. via UDP) without breaking the following ones.
+
+Encoding is too slow to send a state after every fixed step: a state
+with 1000 enemies takes about 4 ms to encode, more than one step
+(1/PHYSICS_HZ). The server therefore only sends SERVER_TICK_HZ states
+per second (see v7/server.py).
+
+Run "python -m v7.delta" for a benchmark.
+"""
+
+POSITION_SCALE = 10 ** COORDINATE_PRECISION
+SCORE_SCALE = 100
+
+# Player fields: position (2), velocity (2), lifes_left, enemies_killed,
+# score, won. Enemy fields: position (2), velocity (2)
+PLAYER_FIELDS = 8
+ENEMY_FIELDS = 4
+
+# The states that have not been acknowledged yet are kept for at most
+# this many states
+MAX_PENDING_STATES = 256
+
+
+# Small negative numbers as small positive numbers: 0, -1, 1, -2, 2 ...
+def zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value):
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+
+# The quantized state of a world: ({player index: fields}, {enemy_id: fields})
+def get_state(world):
+    players = {
+        i: (
+            round(player.position[0] * POSITION_SCALE), round(player.position[1] * POSITION_SCALE),
+            round(player.velocity[0] * POSITION_SCALE), round(player.velocity[1] * POSITION_SCALE),
+            player.lifes_left, player.enemies_killed, round(player.score * SCORE_SCALE), int(player.won)
+        )
+        for i, player in enumerate(world.players)
+    }
+    enemies = {
+        enemy.enemy_id: (
+            round(enemy.position[0] * POSITION_SCALE), round(enemy.position[1] * POSITION_SCALE),
+            round(enemy.velocity[0] * POSITION_SCALE), round(enemy.velocity[1] * POSITION_SCALE)
+        )
+        for enemy in world.enemies
+    }
+
+    # Swarm enemies (see NUMPY_ENEMIES) are read from the arrays directly
+    swarm = world.enemy_swarm
+    if swarm is not None and len(swarm) > 0:
+        n = len(swarm)
+        for enemy_id, (x, y), (velocity_x, velocity_y) in zip(
+                swarm.enemy_ids[:n].tolist(), swarm.positions[:n].tolist(), swarm.velocities[:n].tolist()
+        ):
+            enemies[enemy_id] = (
+                round(x * POSITION_SCALE), round(y * POSITION_SCALE),
+                round(velocity_x * POSITION_SCALE), round(velocity_y * POSITION_SCALE)
+            )
+    return players, enemies
+
+
+def encode_section(buffer, objects, base_objects, field_count):
+    changed = bytearray()
+    changed_count = 0
+    zeros = (0,) * field_count
+    for object_id, values in objects.items():
+        base_values = base_objects.get(object_id, zeros)
+        if values == base_values:
+            continue
+        changed_count += 1
+        write_varint(changed, object_id)
+        mask_index = len(changed)
+        changed.append(0)
+        mask = 0
+        for i in range(field_count):
+            if values[i] != base_values[i]:
+                mask |= 1 << i
+                write_varint(changed, zigzag(values[i] - base_values[i]))
+        changed[mask_index] = mask
+
+    write_varint(buffer, changed_count)
+    buffer += changed
+
+    removed = sorted(object_id for object_id in base_objects if object_id not in objects)
+    write_varint(buffer, len(removed))
+    last_id = 0
+    for object_id in removed:
+        write_varint(buffer, object_id - last_id)
+        last_id = object_id
+
+
+# stream is a binary file object (e.g. io.BytesIO) positioned at the section
+def decode_section(stream, base_objects, field_count):
+    objects = dict(base_objects)
+    zeros = (0,) * field_count
+
+    changed_count = read_varint(stream)
+    for j in range(changed_count):
+        object_id = read_varint(stream)
+        mask = stream.read(1)[0]
+        values = list(objects.get(object_id, zeros))
+        for i in range(field_count):
+            if mask & (1 << i):
+                values[i] += unzigzag(read_varint(stream))
+        objects[object_id] = tuple(values)
+
+    removed_count = read_varint(stream)
+    object_id = 0
+    for j in range(removed_count):
+        object_id += read_varint(stream)
+        del objects[object_id]
+
+    return objects
+
+
+class DeltaEncoder:
+
+    def __init__(self):
+        self.sequence = 0
+
+        # The last state the receiver has acknowledged
+        self.baseline_sequence = 0
+        self.baseline = ({}, {})
+
+        # sequence -> state of the states sent since the baseline
+        self.pending = {}
+
+    def encode(self, world, tick=0):
+        state = get_state(world)
+        self.sequence += 1
+
+        buffer = bytearray()
+        write_varint(buffer, self.sequence)
+        write_varint(buffer, self.baseline_sequence)
+        write_varint(buffer, tick)
+        encode_section(buffer, state[0], self.baseline[0], PLAYER_FIELDS)
+        encode_section(buffer, state[1], self.baseline[1], ENEMY_FIELDS)
+
+        self.pending[self.sequence] = state
+        if len(self.pending) > MAX_PENDING_STATES:
+            del self.pending[min(self.pending)]
+        return bytes(buffer)
+
+    # The receiver has decoded the state with this sequence number, all
+    # following states only contain the changes since then
+    def ack(self, sequence):
+        if sequence > self.baseline_sequence and sequence in self.pending:
+            self.baseline_sequence = sequence
+            self.baseline = self.pending[sequence]
+            self.pending = {s: state for s, state in self.pending.items() if s > sequence}
+
+
+class DeltaDecoder:
+
+    def __init__(self):
+        self.sequence = 0
+        self.tick = None
+
+        # sequence -> decoded (quantized) state, for all states that
+        # could still be used as a baseline
+        self.states = {0: ({}, {})}
+
+        # The last decoded state: {player index: (x, y, velocity_x,
+        # velocity_y, lifes_left, enemies_killed, score, won)} and
+        # {enemy_id: (x, y, velocity_x, velocity_y)}
+        self.players = {}
+        self.enemies = {}
+
+    # Returns the sequence number to acknowledge, or None when the state
+    # arrived too late (a newer state has already been decoded)
+    def decode(self, data):
+        stream = io.BytesIO(data)
+        sequence = read_varint(stream)
+        baseline_sequence = read_varint(stream)
+        tick = read_varint(stream)
+        if sequence <= self.sequence:
+            return None
+        assert baseline_sequence in self.states, "Unknown baseline"
+
+        base_players, base_enemies = self.states[baseline_sequence]
+        players = decode_section(stream, base_players, PLAYER_FIELDS)
+        enemies = decode_section(stream, base_enemies, ENEMY_FIELDS)
+        assert stream.tell() == len(data), "State has the wrong length"
+
+        # The sender will never use an older baseline again
+        self.states = {s: state for s, state in self.states.items() if s >= baseline_sequence}
+        self.states[sequence] = (players, enemies)
+        self.sequence = sequence
+        self.tick = tick
+
+        self.players = {
+            i: (
+                x / POSITION_SCALE, y / POSITION_SCALE, vx / POSITION_SCALE, vy / POSITION_SCALE,
+                lifes_left, enemies_killed, score / SCORE_SCALE, bool(won)
+            )
+            for i, (x, y, vx, vy, lifes_left, enemies_killed, score, won) in players.items()
+        }
+        self.enemies = {
+            i: (x / POSITION_SCALE, y / POSITION_SCALE, vx / POSITION_SCALE, vy / POSITION_SCALE)
+            for i, (x, y, vx, vy) in enemies.items()
+        }
+        return sequence
+
+
+if __name__ == '__main__':
+    # Benchmark: Bytes per state and encode time for 1000 moving enemies
+    # (one state every 5 simulation steps = 60 states per second) with
+    # an immediate ack and with the ack arriving 6 states later, for
+    # Enemy objects and (if NumPy is installed) swarm enemies. Every
+    # decoded state has to be exactly the quantized state of the world
+    import random
+    import struct
+    import time
+    from v7.enemy import Enemy
+    from v7.replay import create_seeded_world
+    from v7.snapshot import snapshot
+
+    steps_per_state = PHYSICS_HZ // 60
+    state_count = 300
+
+    backends = ["objects"]
+    try:
+        from v7.enemy_swarm import EnemySwarm
+        backends.append("swarm")
+    except ImportError:
+        pass
+
+    for backend, ack_delay in [(backend, ack_delay) for backend in backends for ack_delay in (0, 6)]:
+        world = create_seeded_world(0)
+        if backend == "swarm":
+            world.enemy_swarm = EnemySwarm(world)
+        for i in range(1000 - len(world.enemies)):
+            position = (random.uniform(1, 48), random.uniform(2, 18))
+            if backend == "swarm":
+                world.enemy_swarm.spawn(position=position)
+            else:
+                Enemy(world, position=position)
+        world.players[0].keypressed['RIGHT'] = True
+
+        encoder, decoder = DeltaEncoder(), DeltaDecoder()
+        in_flight = []
+        total_bytes, encode_duration = 0, 0
+        for tick in range(state_count):
+            for step in range(steps_per_state):
+                world.update_all(1 / PHYSICS_HZ)
+
+            start_time = time.perf_counter()
+            data = encoder.encode(world, tick)
+            encode_duration += time.perf_counter() - start_time
+            total_bytes += len(data)
+
+            in_flight.append(data)
+            if len(in_flight) > ack_delay:
+                encoder.ack(decoder.decode(in_flight.pop(0)))
+                assert (decoder.states[decoder.sequence]) == encoder.pending.get(decoder.sequence, encoder.baseline)
+
+        for data in in_flight:
+            decoder.decode(data)
+        assert decoder.states[decoder.sequence] == get_state(world), "Decoded state differs"
+        enemy_count = len(world.enemies) + (0 if world.enemy_swarm is None else len(world.enemy_swarm))
+        assert len(decoder.enemies) == enemy_count, "Expected every enemy in the decoded state"
+
+        # The full state as float32 values (id + position + velocity per object)
+        full_bytes = (len(world.players) + enemy_count) * struct.calcsize("<H4f")
+        print(
+            f"{backend:>8} {enemy_count} enemies, ack after {ack_delay} states: {total_bytes / state_count:7.0f} bytes per state "
+            f"({full_bytes} bytes full state, {len(snapshot(world))} bytes snapshot), "
+            f"encode {encode_duration / state_count * 1e6:6.0f} us "
+            f"({encode_duration / state_count * PHYSICS_HZ:.1f} fixed steps)"
+        )
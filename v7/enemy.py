@@ -1,7 +1,7 @@
 
 # Engine
-from engine_v2.perlin import PerlinNoise1D
-from engine_v2.helpers import merge_into_list_dict, get_collision
+from engine_v2.perlin import PerlinNoise1D, PerlinNoiseStream
+from engine_v2.helpers import get_collision, interpolate, CollisionRecord
 from engine_v2.sprite import Sprite
 
 # Constants
@@ -13,29 +13,53 @@ from v7.barrier import Barrier
 
 class Enemy:
 
-    # A list of all Enemy instances
-    instances = []
+    # No per-instance __dict__ (there can be many thousand enemies)
+    __slots__ = (
+        "world", "enemy_id", "position", "velocity", "size", "previous_position",
+        "noise_index", "noise_sign", "noise", "color", "sprite", "collisions"
+    )
 
+    # Reused for every collision detection (enemies are updated one
+    # after another, so they can all share it)
+    collision_record = CollisionRecord()
+
+    # world is the World (v7/world.py) this enemy belongs to
     def __init__(
-            self,
+            self, world,
             color=(75, 75, 75),
             position=(0, 0),
-            size=(14*0.075, 17*0.075)
+            size=(14*0.075, 17*0.075),
+            noise=None
     ):
 
         # All properties as lists with length 2
         # => [x-component, y-component]
-        self.position = position
+        # position and velocity are always updated in place
+        self.position = list(position)
         self.velocity = [0.0, 0.0]
         self.size = list(size)
 
-        # The perlin noise used for the velocity
+        # The position before the last update (used to interpolate
+        # the drawing position between two simulation frames)
+        self.previous_position = list(position)
+
+        # The perlin noise used for the velocity. Can also be an endless
+        # PerlinNoiseStream (noise.width = None), then the movement never
+        # repeats itself
         self.noise_index = 0
         self.noise_sign = 1
-        self.noise = PerlinNoise1D(
-            value_range=(-ENEMY_RUN_VELOCITY, ENEMY_RUN_VELOCITY),
-            repeatable=True
-        )
+        if noise is None and world.noise_bank is not None:
+            # Just a row of the shared bank, starting at a random phase
+            row_index, self.noise_index = world.noise_bank.assign()
+            noise = world.noise_bank.row(row_index)
+        elif noise is None and world.noise_stream:
+            noise = PerlinNoiseStream(value_range=(-ENEMY_RUN_VELOCITY, ENEMY_RUN_VELOCITY))
+        elif noise is None:
+            noise = PerlinNoise1D(
+                value_range=(-ENEMY_RUN_VELOCITY, ENEMY_RUN_VELOCITY),
+                repeatable=True
+            )
+        self.noise = noise
 
         self.color = color
 
@@ -54,16 +78,24 @@ class Enemy:
             'RIGHT_WALL': None
         }
 
-        # Add this new instances to the instance-list from above
-        Enemy.instances.append(self)
+        # Add this new instances to the enemy-list and sweep of its world
+        self.world = world
+        self.enemy_id = len(world.all_enemies)
+        world.all_enemies.append(self)
+        world.enemies.append(self)
+        world.enemy_sweep.insert(self)
 
     def update_for_collisions(self, new_velocity, new_position):
         # 1. Detecting movement collisions with Barriers and other
         #    players. Collisions should refer to the new velocity
         #    and new position that is why we preliminarily update
         #    the players state (self.)
-        self.velocity, self.position = new_velocity, new_position
-        all_collisions = Barrier.detect_all_collisions(self)
+        start_position = list(self.position) if self.world.continuous_collisions else None
+        self.velocity[:] = new_velocity
+        self.position[:] = new_position
+        all_collisions = Barrier.detect_all_collisions(
+            self, start_position=start_position, record=Enemy.collision_record.reset()
+        )
 
         # The strategy now is to go through all the collisions that
         # were detected and successively adjust new_velocity and
@@ -116,13 +148,19 @@ class Enemy:
         #    with collisions -> player state will be updated with the adjusted
         #    values
         self.collisions = new_collisions
-        self.velocity = [round(v, COORDINATE_PRECISION) for v in new_velocity]
-        self.position = [round(p, COORDINATE_PRECISION) for p in new_position]
+        self.velocity[0] = round(new_velocity[0], COORDINATE_PRECISION)
+        self.velocity[1] = round(new_velocity[1], COORDINATE_PRECISION)
+        self.position[0] = round(new_position[0], COORDINATE_PRECISION)
+        self.position[1] = round(new_position[1], COORDINATE_PRECISION)
 
     # Update a single Enemy instance
     def update(self, timedelta):
+        self.previous_position[:] = self.position
+
         # Get the current velocity with perlin noise
-        self.noise_index = (self.noise_index + timedelta*1.5) % 127
+        self.noise_index = self.noise_index + timedelta*1.5
+        if self.noise.width is not None:
+            self.noise_index %= self.noise.width - 1
         run_velocity = self.noise_sign * self.noise[self.noise_index]
 
         # Preliminary new velocity
@@ -163,44 +201,96 @@ class Enemy:
         if any([abs(p) > 200 for p in self.position]):
             self.kill()
 
-    # Update all Enemy instances
+    # Update all Enemy instances of a world
     @staticmethod
-    def update_all(timedelta):
-        for enemy in Enemy.instances:
+    def update_all(world, timedelta):
+        # Iterating over a copy, an enemy can kill itself while updating
+        for enemy in list(world.enemies):
             enemy.update(timedelta)
 
-    # Draw a single Enemy instance
-    def draw(self, game):
+        # All enemies have moved -> re-sort the broadphase once
+        world.enemy_sweep.update()
+
+        if world.enemy_swarm is not None:
+            world.enemy_swarm.update_all(timedelta)
+
+    # Draw a single Enemy instance. alpha is the time between the last
+    # and the next simulation frame (see engine_v2/timestep.py)
+    def draw(self, game, alpha=1):
         # Draw the sprite using the draw_sprite_rect method from the Game class
-        game.draw_sprite_element(self.sprite.getImage(), center_position=self.position)
+        position = interpolate(self.previous_position, self.position, alpha)
+        game.draw_sprite_element(self.sprite.getImage(), center_position=position)
 
         if DRAW_HELPERS:
             game.draw_rect_element(self.position, self.size, color=self.color, alpha=0.3)
             game.draw_helper_points(self)
 
-    # Draw all Enemy instances
+    # Draw all Enemy instances of a world
     @staticmethod
-    def draw_all(game):
-        for enemy in Enemy.instances:
-            enemy.draw(game)
+    def draw_all(world, game, alpha=1):
+        for enemy in world.enemies:
+            enemy.draw(game, alpha)
+
+        if world.enemy_swarm is not None:
+            world.enemy_swarm.draw_all(game, alpha)
 
-    # The method used by a player to detect all collisions with
-    # enemies from the Enemy.instances list
+    # The method used by a player to detect all collisions with the
+    # enemies of its world (added to record, a CollisionRecord)
     @staticmethod
-    def detect_all_collisions(player):
-        all_collisions = {
-            'BARRIER_KILLED': [],
-            'MOVING_OBJECT_KILLED': [],
-        }
-        for enemy in Enemy.instances:
-            all_collisions = merge_into_list_dict(
-                all_collisions, get_collision(
-                    barrier=enemy, moving_object=player, combat_collision=True
-                )
-            )
+    def detect_all_collisions(player, record=None):
+        if record is None:
+            record = CollisionRecord()
+
+        # Only the enemies overlapping the player on the x-axis can collide
+        for enemy in player.world.enemy_sweep.query(player.position, player.size):
+            get_collision(barrier=enemy, moving_object=player, combat_collision=True, record=record)
+
+        if player.world.enemy_swarm is not None:
+            record.update(player.world.enemy_swarm.detect_all_collisions(player))
 
-        return all_collisions
+        return record
 
     def kill(self):
-        # "kill" the Enemy instance by remove it from the instance list
-        Enemy.instances.remove(self)
+        # "kill" the Enemy instance by remove it from the enemy-list of its world
+        self.world.enemies.remove(self)
+        self.world.enemy_sweep.remove(self)
+
+
+if __name__ == '__main__':
+    # Benchmark: Memory per entity (tracemalloc, everything allocated by
+    # the constructors) and simulation speed for many enemies. All
+    # enemies share one noise so that only the entities are measured
+    import time
+    import tracemalloc
+    import pygame
+
+    # The sprites need a display to be converted
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+
+    from v7.world import World
+
+    shared_noise = PerlinNoise1D(value_range=(-ENEMY_RUN_VELOCITY, ENEMY_RUN_VELOCITY), repeatable=True)
+    Enemy(World(), noise=shared_noise).kill()  # Load the sprite images once
+
+    for entity_count in (1000, 10000, 100000):
+        world = World()
+        Barrier(world, x_left=-1000, y_top=1, width=2000, height=1)
+
+        for name, create_entity in (
+            ("Barrier", lambda i: Barrier(world, x_left=i, y_top=-10, width=1, height=1)),
+            ("Enemy", lambda i: Enemy(world, position=(-199 + (i % 39800) * 0.01, 2), noise=shared_noise)),
+        ):
+            tracemalloc.start()
+            entities = [create_entity(i) for i in range(entity_count)]
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print(f"{entity_count:>6} {name:>8}: {memory / entity_count:6.0f} bytes per entity")
+            del entities
+
+        frames = max(1, 100000 // entity_count)
+        start_time = time.perf_counter()
+        for frame in range(frames):
+            Enemy.update_all(world, 1/300)
+        duration = time.perf_counter() - start_time
+        print(f"{entity_count:>6} enemies: {entity_count * frames / duration:10.0f} enemy updates/s")
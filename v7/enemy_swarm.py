@@ -0,0 +1,540 @@
+
+# Libraries
+import math
+import numpy as np
+
+# Engine
+from engine_v2.noise_bank import NoiseBank
+from engine_v2.numpy_helpers import round_like_python
+from engine_v2.sprite import Sprite
+
+# Constants
+from engine_v2.constants import *
+
+# Components
+from v7.barrier import Barrier
+
+
+"""
+An optional NumPy backend for the enemies (used when NUMPY_ENEMIES is
+set to True).
+
+Instead of one Enemy object with its own lists and dicts per enemy, the
+EnemySwarm stores the state of all enemies in NumPy arrays (one row per
+enemy) and moves the whole population with a few array operations per
+simulation frame. The rules are exactly the ones from Enemy.update and
+Enemy.update_for_collisions, also the rounding (see round_like_python)
+and the continuous collisions (world.continuous_collisions). Enemy
+objects and swarm enemies with the same noise move exactly the same.
+
+Every enemy is still available as a SwarmEnemy object, which is just a
+thin view onto one row of these arrays. Therefore the players can kill
+them and get_collision can use them like regular Enemy instances.
+
+The perlin noise of all enemies comes from a shared NoiseBank, every
+enemy only stores its row index in that bank.
+
+Like Barrier.detect_all_collisions, the barrier collisions only test
+the barriers that share a cell of the world's barrier_grid with an
+enemy, so the cost grows with the number of enemies (not with enemies
+times barriers).
+"""
+
+class SwarmEnemy:
+
+    __slots__ = ("swarm", "index")
+
+    def __init__(self, swarm, index):
+        self.swarm = swarm
+        self.index = index
+
+    @property
+    def enemy_id(self):
+        return int(self.swarm.enemy_ids[self.index])
+
+    @property
+    def position(self):
+        return self.swarm.positions[self.index]
+
+    @property
+    def velocity(self):
+        return self.swarm.velocities[self.index]
+
+    @property
+    def size(self):
+        return self.swarm.sizes[self.index]
+
+    @property
+    def color(self):
+        return self.swarm.color
+
+    @property
+    def noise_index(self):
+        return float(self.swarm.noise_indices[self.index])
+
+    @property
+    def noise_sign(self):
+        return int(self.swarm.noise_signs[self.index])
+
+    @property
+    def collisions(self):
+        return {
+            side: (None if math.isnan(value) else float(value))
+            for side, value in zip(
+                ('FLOOR', 'CEILING', 'LEFT_WALL', 'RIGHT_WALL'),
+                self.swarm.collisions[self.index]
+            )
+        }
+
+    def kill(self):
+        self.swarm.remove(self)
+
+
+class EnemySwarm:
+
+    # All arrays with one row per enemy
+    ARRAY_NAMES = (
+        "enemy_ids", "positions", "previous_positions", "velocities", "sizes", "noise_rows", "noise_indices",
+        "noise_signs", "sprite_indices", "sprite_flips", "collisions"
+    )
+
+    # world is the World (v7/world.py) whose barriers the enemies collide with
+    def __init__(self, world, color=(75, 75, 75), capacity=64, noise_bank=None):
+        self.world = world
+        self.color = color
+        self.count = 0
+
+        if noise_bank is None:
+            noise_bank = NoiseBank(value_range=(-ENEMY_RUN_VELOCITY, ENEMY_RUN_VELOCITY))
+        self.noise_bank = noise_bank
+
+        # One row per enemy, only the first self.count rows are in use
+        self.enemy_ids = np.zeros(capacity, dtype=int)
+        self.positions = np.zeros((capacity, 2))
+        self.velocities = np.zeros((capacity, 2))
+        self.previous_positions = np.zeros((capacity, 2))
+        self.sizes = np.zeros((capacity, 2))
+        self.noise_rows = np.zeros(capacity, dtype=int)
+        self.noise_indices = np.zeros(capacity)
+        self.noise_signs = np.ones(capacity)
+        self.sprite_indices = np.zeros(capacity)
+        self.sprite_flips = np.zeros(capacity, dtype=bool)
+
+        # FLOOR, CEILING, LEFT_WALL, RIGHT_WALL - nan means no collision
+        self.collisions = np.full((capacity, 4), np.nan)
+
+        # The view-object for every row
+        self.enemies = []
+
+        # All enemies share one sprite, only the animation state
+        # (sprite index and flip) is stored per enemy
+        self.sprite = None
+
+        # The barriers and blocks of the barrier grid cells as arrays
+        # (see update_barriers). Only rebuilt when barriers are added or
+        # merged (world.barrier_version changes)
+        self.barrier_version = None
+        self.barrier_positions = None
+        self.barrier_sizes = None
+        self.cell_size = None
+        self.block_origin = None
+        self.block_shape = None
+        self.block_starts = None
+        self.block_barriers = None
+
+    def grow(self):
+        capacity = 2 * len(self.positions)
+        for name in EnemySwarm.ARRAY_NAMES:
+            old_array = getattr(self, name)
+            new_array = np.zeros((capacity,) + old_array.shape[1:], dtype=old_array.dtype)
+            new_array[:self.count] = old_array[:self.count]
+            setattr(self, name, new_array)
+
+    # Adds a new enemy, same parameters as the Enemy constructor
+    def spawn(self, position=(0, 0), size=(14*0.075, 17*0.075)):
+        if self.count == len(self.positions):
+            self.grow()
+
+        # The enemy_id is unique among all enemies of the world (also the
+        # Enemy objects), the id is only reserved in world.all_enemies
+        i = self.count
+        self.enemy_ids[i] = len(self.world.all_enemies)
+        self.world.all_enemies.append(None)
+        self.positions[i] = position
+        self.previous_positions[i] = position
+        self.velocities[i] = 0.0
+        self.sizes[i] = size
+        self.noise_rows[i], self.noise_indices[i] = self.noise_bank.assign()
+        self.noise_signs[i] = 1
+        self.sprite_indices[i] = 0
+        self.sprite_flips[i] = False
+        self.collisions[i] = np.nan
+        self.count += 1
+
+        enemy = SwarmEnemy(self, i)
+        self.enemies.append(enemy)
+        return enemy
+
+    # "kill" an enemy by moving the last row into its row
+    def remove(self, enemy):
+        i, last = enemy.index, self.count - 1
+        if i is None:
+            return
+
+        for name in EnemySwarm.ARRAY_NAMES:
+            array = getattr(self, name)
+            array[i] = array[last]
+
+        self.enemies[i] = self.enemies[last]
+        self.enemies[i].index = i
+        self.enemies.pop()
+        self.count -= 1
+        enemy.index = None
+
+    def update_barriers(self):
+        if self.barrier_version == self.world.barrier_version:
+            return
+        self.barrier_version = self.world.barrier_version
+        barriers = self.world.barriers
+        self.barrier_positions = np.array([b.position for b in barriers], dtype=float).reshape(-1, 2)
+        self.barrier_sizes = np.array([b.size for b in barriers], dtype=float).reshape(-1, 2)
+
+        # A block are the 1x1, 1x2, 2x1 or 2x2 grid cells starting at a cell
+        # (column, row), it contains the barriers of all these cells. Any
+        # enemy up to one cell large covers exactly one block -> a single
+        # lookup per enemy instead of one per covered cell
+        grid = self.world.barrier_grid
+        self.cell_size = grid.cell_size
+        if len(grid.cells) == 0:
+            self.block_origin, self.block_shape = (0, 0), (0, 0)
+            self.block_starts, self.block_barriers = np.zeros(2, dtype=int), np.zeros(0, dtype=int)
+            return
+
+        columns, rows = zip(*grid.cells)
+        self.block_origin = (min(columns) - 1, min(rows) - 1)
+        self.block_shape = (max(columns) - min(columns) + 2, max(rows) - min(rows) + 2)
+        barrier_indices = {id(barrier): i for i, barrier in enumerate(barriers)}
+        blocks = {}
+        for (column, row), cell_barriers in grid.cells.items():
+            for width, height in ((1, 1), (1, 2), (2, 1), (2, 2)):
+                for block_column in range(column - width + 1, column + 1):
+                    for block_row in range(row - height + 1, row + 1):
+                        block_index = self.get_block_index(block_column, block_row, width, height)
+                        block = blocks.setdefault(int(block_index), {})
+                        for barrier in cell_barriers:
+                            block[barrier_indices[id(barrier)]] = None
+
+        # The barriers of block i are block_barriers[block_starts[i]:block_starts[i + 1]],
+        # the last block is the empty block outside of the level
+        block_count = 4 * self.block_shape[0] * self.block_shape[1] + 1
+        self.block_starts = np.cumsum([0] + [len(blocks.get(i, ())) for i in range(block_count)])
+        self.block_barriers = np.array(
+            [barrier for i in range(block_count) for barrier in blocks.get(i, ())], dtype=int
+        )
+
+    # The index of the block with width x height cells starting at the cell
+    # (column, row) - all of them can be arrays. Blocks outside of the
+    # level are the empty block
+    def get_block_index(self, column, row, width, height):
+        column, row = column - self.block_origin[0], row - self.block_origin[1]
+        inside = (0 <= column) & (column < self.block_shape[0]) & (0 <= row) & (row < self.block_shape[1])
+        block_index = ((width - 1) * 2 + height - 1) * self.block_shape[0] * self.block_shape[1] + \
+            column * self.block_shape[1] + row
+        return np.where(inside, block_index, 4 * self.block_shape[0] * self.block_shape[1])
+
+    # The (enemy, barrier) pairs that share at least one grid cell (the
+    # same candidates as SpatialGrid.query). A pair can occur more than
+    # once when an enemy is larger than one cell
+    def get_candidate_pairs(self, positions, sizes):
+        first_cells = np.floor((positions - sizes/2) / self.cell_size).astype(int)
+        spans = np.floor((positions + sizes/2) / self.cell_size).astype(int) - first_cells
+
+        # Usually only one block per enemy (larger ones are split into blocks)
+        blocks = []
+        for column_offset in range(0, spans[:, 0].max() + 1, 2):
+            for row_offset in range(0, spans[:, 1].max() + 1, 2):
+                width, height = spans[:, 0] - column_offset + 1, spans[:, 1] - row_offset + 1
+                blocks.append(np.where(
+                    (width > 0) & (height > 0),
+                    self.get_block_index(
+                        first_cells[:, 0] + column_offset, first_cells[:, 1] + row_offset,
+                        np.minimum(width, 2), np.minimum(height, 2)
+                    ),
+                    4 * self.block_shape[0] * self.block_shape[1]
+                ))
+        enemies = np.tile(np.arange(len(positions)), len(blocks))
+        blocks = np.concatenate(blocks)
+
+        # One pair per barrier in these blocks
+        starts = self.block_starts[blocks]
+        counts = self.block_starts[blocks + 1] - starts
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(enemies, counts), self.block_barriers[np.repeat(starts, counts) + offsets]
+
+    # Same as Barrier.detect_all_collisions for all enemies at once, with
+    # start_positions the same as with its start_position (get_swept_
+    # collision). Returns the (n, 4) array of FLOOR, CEILING, LEFT_WALL,
+    # RIGHT_WALL
+    def detect_barrier_collisions(self, positions, sizes, start_positions=None):
+        self.update_barriers()
+        n = len(positions)
+        all_collisions = np.full((n, 4), np.nan)
+        if len(self.barrier_positions) == 0 or n == 0:
+            return all_collisions
+
+        # All pair arrays have one entry per candidate (enemy, barrier)
+        # pair. With start_positions the candidates are the barriers around
+        # the area swept through (like in Barrier.detect_all_collisions)
+        if start_positions is None:
+            enemies, barriers = self.get_candidate_pairs(positions, sizes)
+        else:
+            enemies, barriers = self.get_candidate_pairs(
+                (positions + start_positions)/2, sizes + np.abs(positions - start_positions)
+            )
+        bx, by = self.barrier_positions[barriers, 0], self.barrier_positions[barriers, 1]
+        bw, bh = self.barrier_sizes[barriers, 0], self.barrier_sizes[barriers, 1]
+        x, y = positions[enemies, 0], positions[enemies, 1]
+        w, h = sizes[enemies, 0], sizes[enemies, 1]
+
+        # Same as get_collision
+        dx = x - bx
+        dy = y - by
+        horizontal_overlap = (w/2 + bw/2) - np.abs(dx)
+        vertical_overlap = (h/2 + bh/2) - np.abs(dy)
+
+        overlap = (vertical_overlap > 0) & (horizontal_overlap > 0)
+        vertical = overlap & (vertical_overlap < (3 * horizontal_overlap))
+        horizontal = overlap & ~vertical
+        above, right = dy > 0, dx > 0
+
+        # Same as get_swept_collision for the pairs not overlapping at the
+        # new position: The side through which the enemy has entered the
+        # barrier first (the later entry time of both dimensions)
+        if start_positions is not None:
+            start_x, start_y = start_positions[enemies, 0], start_positions[enemies, 1]
+            entry_times, exit_times, sweepable = [], [], ~overlap
+            for position, start_position, barrier_position, size in (
+                    (x, start_x, bx, (bw + w)/2), (y, start_y, by, (bh + h)/2)
+            ):
+                distance = position - start_position
+                limit_min, limit_max = barrier_position - size, barrier_position + size
+                not_moving = distance == 0
+                # Not moving and not overlapping in this dimension -> never hit
+                sweepable &= ~not_moving | ((limit_min < start_position) & (start_position < limit_max))
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    times_min = (limit_min - start_position) / distance
+                    times_max = (limit_max - start_position) / distance
+                entry_times.append(np.where(not_moving, -np.inf, np.minimum(times_min, times_max)))
+                exit_times.append(np.where(not_moving, np.inf, np.maximum(times_min, times_max)))
+
+            entry_time = np.maximum(*entry_times)
+            swept = sweepable & (entry_time <= np.minimum(*exit_times)) & (0 <= entry_time) & (entry_time <= 1)
+            swept_vertical = swept & (entry_times[1] >= entry_times[0])
+            vertical |= swept_vertical
+            horizontal |= swept & ~swept_vertical
+
+            # Moving down = hitting a floor, moving left = hitting a left wall
+            above = np.where(swept, y < start_y, above)
+            right = np.where(swept, x < start_x, right)
+
+        # The relevant collision is the highest floor, lowest ceiling, ...
+        # (fmax/fmin ignore nan, so nan is left when there is no collision)
+        for column, mask, values, reduce in (
+                (0, vertical & above, by + bh/2, np.fmax),
+                (1, vertical & ~above, by - bh/2, np.fmin),
+                (2, horizontal & right, bx + bw/2, np.fmax),
+                (3, horizontal & ~right, bx - bw/2, np.fmin)
+        ):
+            reduce.at(all_collisions[:, column], enemies[mask], values[mask])
+
+        return all_collisions
+
+    # Same as Enemy.update + Enemy.update_for_collisions for all enemies
+    def update_all(self, timedelta):
+        n = self.count
+        if n == 0:
+            return
+
+        positions, velocities, sizes = self.positions[:n], self.velocities[:n], self.sizes[:n]
+        noise_signs, collisions = self.noise_signs[:n], self.collisions[:n]
+        self.previous_positions[:n] = positions
+
+        # 1. Get the current velocity with perlin noise (one gather from
+        #    the noise bank for all enemies)
+        noise_indices = (self.noise_indices[:n] + timedelta * 1.5) % (self.noise_bank.width - 1)
+        self.noise_indices[:n] = noise_indices
+        run_velocity = self.noise_bank.sample(self.noise_rows[:n], noise_indices) * noise_signs
+
+        # 2. Set the sprite flip direction for the current movement direction
+        #    and only update the sprite if the enemy is moving
+        self.sprite_flips[:n] = run_velocity < 0
+        moving = np.abs(run_velocity) > 0.05 * ENEMY_RUN_VELOCITY
+        self.sprite_indices[:n] += np.where(
+            moving, timedelta * np.abs(MAX_ENEMY_RUN_FPS * run_velocity) / ENEMY_RUN_VELOCITY, 0
+        )
+
+        # 3. Vertical velocity: Jump if velocity is high, gravity if
+        #    there is no floor and stop otherwise
+        on_floor = ~np.isnan(collisions[:, 0])
+        jumping = on_floor & (np.abs(run_velocity) > 0.7 * ENEMY_RUN_VELOCITY) & (velocities[:, 1] < ERROR_MARGIN)
+        new_velocities = np.empty((n, 2))
+        new_velocities[:, 0] = run_velocity
+        new_velocities[:, 1] = np.where(
+            on_floor, np.where(jumping, ENEMY_JUMP_VELOCITY, 0.0), velocities[:, 1] - GRAVITY * timedelta
+        )
+
+        # 4. Preliminary new position
+        new_positions = positions + new_velocities * timedelta
+
+        # 5. Snap to the relevant floor/ceiling/walls
+        all_collisions = self.detect_barrier_collisions(
+            new_positions, sizes, start_positions=positions if self.world.continuous_collisions else None
+        )
+        floor, ceiling, left_wall, right_wall = (~np.isnan(all_collisions[:, i]) for i in range(4))
+
+        floor &= new_velocities[:, 1] < ERROR_MARGIN
+        ceiling &= ~floor & (new_velocities[:, 1] > -ERROR_MARGIN)
+        left_wall &= new_velocities[:, 0] < ERROR_MARGIN
+        right_wall &= ~left_wall & (new_velocities[:, 0] > -ERROR_MARGIN)
+
+        vertical_offset = sizes[:, 1]/2 - ERROR_MARGIN
+        new_positions[:, 1] = np.where(
+            floor, all_collisions[:, 0] + vertical_offset,
+            np.where(ceiling, all_collisions[:, 1] - vertical_offset, new_positions[:, 1])
+        )
+        new_velocities[:, 1] = np.where(floor | ceiling, 0.0, new_velocities[:, 1])
+
+        # Turn around at walls
+        walls = left_wall | right_wall
+        new_positions[:, 0] = np.where(
+            left_wall, all_collisions[:, 2], np.where(right_wall, all_collisions[:, 3], new_positions[:, 0])
+        )
+        new_velocities[:, 0] = np.where(walls, -new_velocities[:, 0], new_velocities[:, 0])
+        noise_signs[:] = np.where(walls, -noise_signs, noise_signs)
+
+        # 6. Store the adjusted state (velocities and positions rounded at once)
+        collisions[:] = np.where(np.column_stack((floor, ceiling, left_wall, right_wall)), all_collisions, np.nan)
+        rounded = round_like_python(np.concatenate((new_velocities, new_positions), axis=1), COORDINATE_PRECISION)
+        velocities[:] = rounded[:, :2]
+        positions[:] = rounded[:, 2:]
+
+        # Occasionally enemies somehow glitch outside the drawing area -> this is a monkey patch
+        for i in np.flatnonzero(np.any(np.abs(positions) > 200, axis=1))[::-1]:
+            self.remove(self.enemies[i])
+
+    def draw_all(self, game, alpha=1):
+        if self.sprite is None:
+            self.sprite = Sprite(
+                spritesheet_path="assets/dungeon_spritesheets/enemy_spritesheet@8x.png",
+                row_count=1, column_count=5, number_of_images=4
+            )
+        frame_count = len(self.sprite.images)
+        n = self.count
+        positions = self.previous_positions[:n] + (self.positions[:n] - self.previous_positions[:n]) * alpha
+
+        for i in range(self.count):
+            self.sprite.size = [SCALING_FACTOR * s for s in self.sizes[i]]
+            self.sprite.index = self.sprite_indices[i] % frame_count
+            self.sprite.flip = (bool(self.sprite_flips[i]), False)
+            game.draw_sprite_element(self.sprite.getImage(), center_position=positions[i])
+
+            if DRAW_HELPERS:
+                game.draw_rect_element(self.positions[i], self.sizes[i], color=self.color, alpha=0.3)
+                game.draw_helper_points(self.enemies[i])
+
+    # Same as Enemy.detect_all_collisions
+    def detect_all_collisions(self, player):
+        n = self.count
+        dx = player.position[0] - self.positions[:n, 0]
+        dy = player.position[1] - self.positions[:n, 1]
+        horizontal_overlap = (player.size[0]/2 + self.sizes[:n, 0]/2) - np.abs(dx)
+        vertical_overlap = (player.size[1]/2 + self.sizes[:n, 1]/2) - np.abs(dy)
+
+        overlap = (vertical_overlap > 0) & (horizontal_overlap > 0)
+        barrier_killed = overlap & (vertical_overlap < horizontal_overlap) & (dy > 0)
+
+        return {
+            'BARRIER_KILLED': [self.enemies[i] for i in np.flatnonzero(barrier_killed)],
+            'MOVING_OBJECT_KILLED': [self.enemies[i] for i in np.flatnonzero(overlap & ~barrier_killed)],
+        }
+
+    def __len__(self):
+        return self.count
+
+
+if __name__ == '__main__':
+    import random
+    import time
+    from v7.enemy import Enemy
+    from v7.world import World
+
+    # The regular level (the 11 barriers from v7.main) with
+    # extra_barrier_count additional small platforms
+    def create_level(extra_barrier_count=0, continuous_collisions=False):
+        world = World(continuous_collisions=continuous_collisions)
+        Barrier(world, x_left=-1, y_top=21, width=52, height=1)
+        Barrier(world, x_left=-1, y_top=1, width=52, height=1)
+        Barrier(world, x_left=-1, y_top=21, width=1, height=22)
+        Barrier(world, x_left=50, y_top=21, width=1, height=22)
+        Barrier(world, x_left=12, y_top=6, width=5, height=1)
+        Barrier(world, x_left=19, y_top=8, width=5, height=1)
+        Barrier(world, x_left=26, y_top=10, width=5, height=1)
+        Barrier(world, x_left=36, y_top=9, width=2, height=8)
+        Barrier(world, x_left=38, y_top=7, width=2, height=6)
+        Barrier(world, x_left=40, y_top=5, width=2, height=4)
+        Barrier(world, x_left=42, y_top=3, width=2, height=2)
+
+        random.seed(0)
+        for i in range(extra_barrier_count):
+            Barrier(world, x_left=random.uniform(0, 48), y_top=random.uniform(3, 20), width=0.5, height=0.3)
+        return world
+
+    # Test: Enemy objects and swarm enemies with the same noise bank seed
+    # move exactly the same (every position and velocity, every step).
+    # With continuous collisions and 30 steps per second the enemies are
+    # fast enough to pass through the thin platforms without sweeping
+    for continuous_collisions, hz in ((False, 300), (True, 300), (True, 30)):
+        object_world = create_level(200, continuous_collisions)
+        object_world.noise_bank = NoiseBank(value_range=(-ENEMY_RUN_VELOCITY, ENEMY_RUN_VELOCITY))
+        swarm_world = create_level(200, continuous_collisions)
+        swarm_world.enemy_swarm = EnemySwarm(swarm_world)
+
+        for i in range(200):
+            position = (1 + (i % 48), 2 + (i // 48) * 4)
+            Enemy(object_world, position=position)
+            swarm_world.enemy_swarm.spawn(position=position)
+
+        for step in range(3000):
+            Enemy.update_all(object_world, 1/hz)
+            Enemy.update_all(swarm_world, 1/hz)
+            object_states = {
+                enemy.enemy_id: (enemy.position, enemy.velocity) for enemy in object_world.enemies
+            }
+            swarm_states = {
+                enemy.enemy_id: (enemy.position.tolist(), enemy.velocity.tolist())
+                for enemy in swarm_world.enemy_swarm.enemies
+            }
+            assert object_states == swarm_states, f"Enemy objects and swarm enemies differ at step {step}"
+        print(
+            f"continuous_collisions={continuous_collisions}, {hz} steps/s: Enemy objects and swarm enemies "
+            f"are the same for 3000 steps ({len(swarm_states)} alive)"
+        )
+
+    # Benchmark: Simulation frames per second for large swarms on the
+    # regular level and on the same level with 1000 additional platforms
+    for extra_barrier_count in (0, 1000):
+        world = create_level(extra_barrier_count)
+        for enemy_count in (100, 1000, 10000):
+            swarm = EnemySwarm(world)
+            for i in range(enemy_count):
+                swarm.spawn(position=(1 + (i % 480) * 0.1, 2 + (i // 480) * 0.01))
+
+            frames = 300
+            start_time = time.perf_counter()
+            for frame in range(frames):
+                swarm.update_all(1/300)
+            duration = time.perf_counter() - start_time
+            print(
+                f"{len(world.barriers):>5} barriers, {enemy_count:>6} enemies: "
+                f"{frames / duration:8.1f} simulation frames/s ({len(swarm)} alive)"
+            )
@@ -42,18 +42,15 @@ def get_sprite(spritesheet, i, j, n, **kwargs):
     )
 
 
-# The sprites the two players will use. Will be passed to the player
-# upon the player initialization inside main after the graphics import
-player_1_sprites = {
-    "sprite_run": get_sprite(player_spritesheet, 0, 0, 8),
-    "sprite_jump_up": get_sprite(player_spritesheet, 0, 0, 1),
-    "sprite_jump_down": get_sprite(player_spritesheet, 0, 8, 1)
-}
-player_2_sprites = {
-    "sprite_run": get_sprite(player_spritesheet, 1, 0, 8),
-    "sprite_jump_up": get_sprite(player_spritesheet, 1, 0, 1),
-    "sprite_jump_down": get_sprite(player_spritesheet, 1, 8, 1)
-}
+# The sprites a player will use (row 0 or 1 of the player spritesheet).
+# Every player needs its own sprites since they store the animation
+# state, the images themselves are shared (see Sprite.animation_cache)
+def get_player_sprites(row):
+    return {
+        "sprite_run": get_sprite(player_spritesheet, row, 0, 8),
+        "sprite_jump_up": get_sprite(player_spritesheet, row, 0, 1),
+        "sprite_jump_down": get_sprite(player_spritesheet, row, 8, 1)
+    }
 
 
 # Draws the winning pole on the right hand side
@@ -109,18 +106,45 @@ def draw_player_stats(game, player_1, player_2):
         game.draw_sprite(dead_enemy_sprite.getImage(), (game.width - 32 - i * 32, 90))
 
 
-# Draws the debugging stats, when DRAW_HELPERS is set to true
+# Draws the debugging stats, when DRAW_HELPERS is set to true. All
+# values are rounded, so a player standing still (or moving slowly) keeps
+# drawing the same texts and these can be taken from the text cache.
+# The renders of the text cache line itself are not shown in that line,
+# otherwise every render would change the line again
+text_cache_line_renders = 0
 def draw_debug_stats(game, player_1):
-    game.draw_text(text=f"collisions: {player_1.collisions}",
+    global text_cache_line_renders
+
+    collisions = ", ".join(
+        f"{side}: {player_1.collisions[side]}" for side in ('FLOOR', 'CEILING', 'LEFT_WALL', 'RIGHT_WALL')
+    )
+    game.draw_text(text=f"collisions: {collisions}",
                    x_left=5, y_top=5, font_size=20, color=player_1.color)
-    game.draw_text(text=f"position: {player_1.position}, velocity: {player_1.velocity}",
+    position = [round(value, 1) for value in player_1.position]
+    velocity = [round(value, 1) for value in player_1.velocity]
+    game.draw_text(text=f"position: {position}, velocity: {velocity}",
                    x_left=5, y_top=30, font_size=20, color=player_1.color)
 
+    text_cache_misses = game.text_cache_misses
+    game.draw_text(text=f"text cache: {text_cache_misses - text_cache_line_renders} texts rendered, "
+                        f"{len(game.fonts)} fonts loaded",
+                   x_left=5, y_top=55, font_size=20, color=player_1.color)
+    text_cache_line_renders += game.text_cache_misses - text_cache_misses
+
 
 # Draws the fps in the bottom left corner
-def draw_fps(game):
+# (and with a fixed timestep how many steps have been dropped/caught up).
+# The fps are rounded to FPS_TEXT_STEP, otherwise every small change of
+# the fps would render a new text
+FPS_TEXT_STEP = 5
+def draw_fps(game, simulation_fps, timestep=None):
+    simulation_fps = round(simulation_fps / FPS_TEXT_STEP) * FPS_TEXT_STEP
+    canvas_fps = round(game.fps / FPS_TEXT_STEP) * FPS_TEXT_STEP
+    text = f"{simulation_fps} FPS (simulation) {canvas_fps} FPS (canvas)"
+    if timestep is not None:
+        text += f" {timestep.dropped_steps} steps dropped {timestep.caught_up_steps} steps caught up"
     game.draw_text(
-        text=f"{game.fps * SIMULATION_FRAMES_PER_DRAW} FPS (simulation) {game.fps} FPS (canvas)",
+        text=text,
         x_left=6, y_bottom=6, font_size=12
     )
 
@@ -138,3 +162,50 @@ def draw_scores(game, sorted_scores):
 
         for i in range(len(sorted_scores)):
             game.draw_text(f"{sorted_scores[i]['name']}: {sorted_scores[i]['score']}", y_center=140 + 25 * i, font_size=20)
+
+
+if __name__ == '__main__':
+    # Test: Once all texts of the HUD have been drawn, a steady-state
+    # frame (both players standing still) does no font work at all. Every
+    # font.render call is counted, not only the text cache misses
+    import os
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import v7.main as main
+
+    main.setup(seed=0)
+    game = main.game
+
+    class CountingFont:
+        def __init__(self, font):
+            self.font = font
+            self.render_count = 0
+
+        def render(self, *args):
+            self.render_count += 1
+            return self.font.render(*args)
+
+    get_font = game.get_font
+    fonts = {}
+    def get_counting_font(font_family, font_size):
+        font = get_font(font_family, font_size)
+        if font not in fonts:
+            fonts[font] = CountingFont(font)
+        return fonts[font]
+    game.get_font = get_counting_font
+
+    def run_frames(frame_count):
+        for frame in range(frame_count):
+            for i in range(main.timestep.advance(game.timedelta)):
+                main.update(main.timestep.timedelta)
+            main.draw(main.timestep.alpha)
+            draw_debug_stats(game, main.player_1)
+        return sum(font.render_count for font in fonts.values())
+
+    # The players land on the floor and the fps settle down
+    warm_up_renders = run_frames(120)
+    steady_state_renders = run_frames(300) - warm_up_renders
+    print(
+        f"{warm_up_renders} font renders during the first 120 frames, "
+        f"{steady_state_renders} during the next 300 frames"
+    )
+    assert steady_state_renders == 0, "Expected no font renders in steady-state frames"
@@ -0,0 +1,123 @@
+
+# Libraries
+import json
+import random
+import time
+
+# Constants
+from engine_v2.constants import *
+
+# Components
+import v7.main as main
+from v7.win_logic import check_for_win
+
+
+"""
+Runs the game without a window (e.g. on a server without a display).
+
+Nothing is being drawn and the simulation runs as fast as possible with
+fixed steps of 1/PHYSICS_HZ seconds. Since there is no keyboard, the
+players are controlled by an input source:
+
+    inputs = ScriptedInput([
+        (0, 0, 'RIGHT', True),     # step 0: player 1 starts running right
+        (300, 0, 'UP', True),      # step 300: player 1 jumps
+        (330, 0, 'UP', False),
+    ])
+    stats = run_headless(inputs, max_steps=3000)
+    stats["steps_per_second"]
+
+Input sources can be stored as and loaded from a json file (recorded
+input), ScriptedInput.random generates some random input for testing.
+
+Run "python -m v7.headless" for a benchmark.
+"""
+
+
+class ScriptedInput:
+
+    # events = [(step, player_index, direction, pressed), ...] with
+    # direction being one of 'UP', 'LEFT', 'DOWN', 'RIGHT'
+    def __init__(self, events=()):
+        self.events = sorted([tuple(event) for event in events], key=lambda event: event[0])
+        self.next_event_index = 0
+
+    # Presses/releases the keys of all events up to the given step
+    def apply(self, step, players):
+        while self.next_event_index < len(self.events) and self.events[self.next_event_index][0] <= step:
+            event_step, player_index, direction, pressed = self.events[self.next_event_index]
+            players[player_index].keypressed[direction] = pressed
+            self.next_event_index += 1
+
+    def reset(self):
+        self.next_event_index = 0
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.events, f)
+
+    @staticmethod
+    def load(path):
+        with open(path) as f:
+            return ScriptedInput(json.load(f))
+
+    # Random key presses for player_count players (seed -> same input)
+    @staticmethod
+    def random(steps, player_count=2, seed=None, mean_press_steps=PHYSICS_HZ // 2):
+        rng = random.Random(seed)
+        events = []
+        for player_index in range(player_count):
+            for direction in ('UP', 'LEFT', 'DOWN', 'RIGHT'):
+                step, pressed = 0, False
+                while step < steps:
+                    step += rng.randint(1, 2 * mean_press_steps)
+                    pressed = not pressed
+                    events.append((step, player_index, direction, pressed))
+        return ScriptedInput(events)
+
+
+# Simulates a new world until the game is finished (or max_steps have
+# been simulated) and returns some statistics about the run
+def run_headless(input_source=None, max_steps=60 * PHYSICS_HZ, seed=None):
+    if seed is not None:
+        random.seed(seed)
+    world = main.create_world()
+
+    players = world.players
+    timedelta = 1 / PHYSICS_HZ
+
+    start_time = time.perf_counter()
+    step = 0
+    while step < max_steps and world.game_finish_time is None:
+        if input_source is not None:
+            input_source.apply(step, players)
+
+        world.update_all(timedelta)
+        check_for_win(world)
+        step += 1
+    duration = time.perf_counter() - start_time
+
+    return {
+        "steps": step,
+        "simulated_seconds": step * timedelta,
+        "duration": duration,
+        "steps_per_second": step / duration if duration > 0 else float("inf"),
+        "finished": world.game_finish_time is not None,
+        "sorted_scores": world.sorted_scores,
+        "players": [
+            {"name": player.name, "position": list(player.position), "lifes_left": player.lifes_left,
+             "enemies_killed": player.enemies_killed, "score": player.score}
+            for player in players
+        ],
+    }
+
+
+if __name__ == '__main__':
+    # Benchmark: One minute of game time with random input
+    stats = run_headless(ScriptedInput.random(60 * PHYSICS_HZ, seed=0), max_steps=60 * PHYSICS_HZ, seed=0)
+    print(
+        f"{stats['steps']} steps ({stats['simulated_seconds']:.1f} s game time) in {stats['duration']:.2f} s "
+        f"= {stats['steps_per_second']:.0f} steps/s ({stats['steps_per_second'] / PHYSICS_HZ:.1f}x real time)"
+    )
+    for player in stats["players"]:
+        print(f"  {player['name']}: {player['lifes_left']} lifes left, {player['enemies_killed']} enemies killed")
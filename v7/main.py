@@ -1,11 +1,13 @@
 
 # Libraries
 import pygame
+import random
 import time
 from datetime import datetime
 
 # Engine
 from engine_v2.game import Game
+from engine_v2.timestep import FixedTimestep
 
 # Constants
 from pygame.constants import *
@@ -15,98 +17,172 @@ from engine_v2.constants import *
 from v7.player import Player
 from v7.enemy import Enemy
 from v7.barrier import Barrier
+from v7.world import World
 from v7.win_logic import check_for_win
 
-sorted_scores = []
-game_finish_time = None
-win_area = ((46.5, 47.5), (1, 13))
+timestep = FixedTimestep()
+
+# Everything below is only created when setup() is called (by run() or
+# v7.headless), so importing this module does not open a window
+game = None
+graphics = None
+world = None
+player_1 = None
+player_2 = None
+
+
+# Creates a new world with the level, its enemies and the two players.
+# Every call creates an independent world (see v7/world.py)
+def create_world(noise_stream=NOISE_STREAM):
+    # Graphics have to be import after the game has been initialized
+    # (Pygame constraint) - without a game the images are just not
+    # converted for the display
+    import v7.graphics as graphics
+
+    world = World(win_area=((46.5, 47.5), (1, 13)), noise_stream=noise_stream)
+
+    # 1. Initialize players & pass the sprites from v7.graphics
+    Player(
+        world, "Max", color=(220, 74, 123), position=(21.5, 12), **graphics.get_player_sprites(0),
+        keymap={K_w: 'UP', K_a: 'LEFT', K_s: 'DOWN', K_d: 'RIGHT'}
+    )
+    Player(
+        world, "Moritz", color=(218, 78, 56), position=(14.5, 12), **graphics.get_player_sprites(1),
+        keymap={K_UP: 'UP', K_LEFT: 'LEFT', K_DOWN: 'DOWN', K_RIGHT: 'RIGHT'}
+    )
+
+    # 2. Initialize enemies
+    if NOISE_BANK:
+        from engine_v2.noise_bank import NoiseBank
+        world.noise_bank = NoiseBank(
+            value_range=(-ENEMY_RUN_VELOCITY, ENEMY_RUN_VELOCITY),
+            cache_path=NOISE_BANK_CACHE
+        )
+
+    if NUMPY_ENEMIES:
+        from v7.enemy_swarm import EnemySwarm
+        world.enemy_swarm = EnemySwarm(world, noise_bank=world.noise_bank)
+
+    for x in range(2, 32, 3):
+        if NUMPY_ENEMIES:
+            world.enemy_swarm.spawn(position=(x, 2))
+        else:
+            Enemy(world, position=(x, 2))
+
+    # 3. Initialize barriers
+    Barrier(world, x_left=-1, y_top=21, width=52, height=1)  # window top
+    Barrier(world, x_left=-1, y_top=1, width=52, height=1)  # window bottom
+    Barrier(world, x_left=-1, y_top=21, width=1, height=22)  # window left
+    Barrier(world, x_left=50, y_top=21, width=1, height=22)  # window right
 
-# 1. Initialize game
-game = Game(
-    width=50 * SCALING_FACTOR,
-    height=20 * SCALING_FACTOR,
-    print_fps=False, max_fps=MAX_DRAW_FPS
-)
+    Barrier(world, x_left=12, y_top=6, width=5, height=1)  # step 1
+    Barrier(world, x_left=19, y_top=8, width=5, height=1)  # step 2
+    Barrier(world, x_left=26, y_top=10, width=5, height=1)  # step 3
 
+    Barrier(world, x_left=36, y_top=9, width=2, height=8)  # pyramid column 1
+    Barrier(world, x_left=38, y_top=7, width=2, height=6)  # pyramid column 2
+    Barrier(world, x_left=40, y_top=5, width=2, height=4)  # pyramid column 3
+    Barrier(world, x_left=42, y_top=3, width=2, height=2)  # pyramid column 4
 
-# 2. Initialize graphics
-# Graphics have to be import after the game has been initialized! (Pygame constraint)
-from v7.graphics import *
+    if COALESCE_BARRIERS:
+        Barrier.coalesce_all(world)
 
-# 3. Initialize players & pass the sprites from v6.graphics
-player_1 = Player(
-    "Max", color=(220, 74, 123), position=(21.5, 12), **player_1_sprites,
-    keymap={K_w: 'UP', K_a: 'LEFT', K_s: 'DOWN', K_d: 'RIGHT'}
-)
-player_2 = Player(
-    "Moritz", color=(218, 78, 56), position=(14.5, 12), **player_2_sprites,
-    keymap={K_UP: 'UP', K_LEFT: 'LEFT', K_DOWN: 'DOWN', K_RIGHT: 'RIGHT'}
-)
+    return world
 
 
-# 4. Initialize enemies
-for x in range(2, 32, 3):
-    Enemy(position=(x, 2))
-    pass
+# With headless=True no window is being created and no image is being
+# converted for the display, the game can then only be simulated (see
+# v7/headless.py). With a seed the world is always the same (see
+# v7/replay.py)
+def setup(headless=False, seed=None):
+    global game, graphics, world, player_1, player_2
 
+    if game is not None:
+        return
 
-# 5. Initialize barriers
-Barrier(x_left=-1, y_top=21, width=52, height=1)  # window top
-Barrier(x_left=-1, y_top=1, width=52, height=1)  # window bottom
-Barrier(x_left=-1, y_top=21, width=1, height=22)  # window left
-Barrier(x_left=50, y_top=21, width=1, height=22)  # window right
+    if seed is not None:
+        random.seed(seed)
 
-Barrier(x_left=12, y_top=6, width=5, height=1)  # step 1
-Barrier(x_left=19, y_top=8, width=5, height=1)  # step 2
-Barrier(x_left=26, y_top=10, width=5, height=1)  # step 3
+    # 1. Initialize game
+    game = Game(
+        width=50 * SCALING_FACTOR,
+        height=20 * SCALING_FACTOR,
+        print_fps=False, max_fps=MAX_DRAW_FPS,
+        dirty_rects=DIRTY_RECTS, headless=headless
+    )
 
-Barrier(x_left=36, y_top=9, width=2, height=8)  # pyramid column 1
-Barrier(x_left=38, y_top=7, width=2, height=6)  # pyramid column 2
-Barrier(x_left=40, y_top=5, width=2, height=4)  # pyramid column 3
-Barrier(x_left=42, y_top=3, width=2, height=2)  # pyramid column 4
+    # 2. Initialize graphics
+    # Graphics have to be import after the game has been initialized! (Pygame constraint)
+    import v7.graphics as graphics
+
+    # 3. Initialize the world with the level, enemies and players
+    world = create_world()
+    player_1, player_2 = world.players
 
 
 def update(timedelta):
-    # Only the moving objects have to be updated
-    Enemy.update_all(timedelta)
-    Player.update_all(timedelta)
+    world.update_all(timedelta)
 
 
-def draw():
-    # 1. Draw game elements
+def draw_static_elements():
     game.draw_background()
-    Barrier.draw_all(game)
-    draw_winning_pole(game)
-    Enemy.draw_all(game)
-    Player.draw_all(game)
+    Barrier.draw_all(world, game)
+    graphics.draw_winning_pole(game)
+
+
+# alpha is the time between the last and the next simulation
+# frame, the moving objects will be drawn in between
+def draw(alpha=1):
+    # 1. Draw game elements. The elements that never move are only
+    #    drawn when the barriers have changed, otherwise the cached
+    #    layer with all of them is drawn at once
+    game.draw_static_layer(world.barrier_version, draw_static_elements)
+    Enemy.draw_all(world, game, alpha)
+    Player.draw_all(world, game, alpha)
 
     # 2. Draw scores if score-list is not empty
-    draw_scores(game, sorted_scores)
+    graphics.draw_scores(game, world.sorted_scores)
 
     # 3. Draw text in top left corner
     if DRAW_HELPERS:
-        draw_debug_stats(game, player_1)
+        graphics.draw_debug_stats(game, player_1)
     else:
-        draw_player_stats(game, player_1, player_2)
+        graphics.draw_player_stats(game, player_1, player_2)
 
     # 4. Draw bottom left fps
-    draw_fps(game)
+    if FIXED_TIMESTEP:
+        graphics.draw_fps(game, timestep.hz, timestep)
+    elif world.continuous_collisions:
+        graphics.draw_fps(game, game.fps)
+    else:
+        graphics.draw_fps(game, game.fps * SIMULATION_FRAMES_PER_DRAW)
 
     # 5. Update game window (and fps)
     game.update()
 
 
-def run():
-    global sorted_scores
-    global game_finish_time
+# With a record_path the input of the match is recorded, the match can
+# then be replayed with v7.replay.replay(record_path)
+def run(record_path=None):
+    recorder = None
+    if record_path is not None:
+        from v7.replay import ReplayRecorder
+        assert FIXED_TIMESTEP and not SLOWDOWN, "Only matches with a fixed timestep can be recorded"
+        seed = random.randrange(2 ** 64)
+        recorder = ReplayRecorder(record_path, seed, hz=timestep.hz, player_count=2)
+        setup(seed=seed)
+    else:
+        setup()
 
-    # After game_finish_time has been set from inside check_for_win
+    # After world.game_finish_time has been set from inside check_for_win
     # The game will continue to run for 8 seconds and then end
-    while game_finish_time is None or (datetime.now() - game_finish_time).seconds < 8:
+    while world.game_finish_time is None or (datetime.now() - world.game_finish_time).seconds < 8:
 
         # 1. Attach event handler
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                if recorder is not None:
+                    recorder.close()
                 game.exit()
 
             if event.type in (pygame.KEYDOWN, pygame.KEYUP):
@@ -116,7 +192,22 @@ def run():
                     player_2.keypress(event.key, event.type == pygame.KEYDOWN)
 
         # 2. Update (simulation)
-        if not SLOWDOWN:
+        if FIXED_TIMESTEP and not SLOWDOWN:
+            # Run as many fixed steps as fit into the time of the last
+            # frame. The remaining time will be left for the next frame
+            for i in range(timestep.advance(game.timedelta)):
+                if recorder is not None:
+                    recorder.record(world.players)
+                update(timestep.timedelta)
+                check_for_win(world)
+
+        elif world.continuous_collisions and not SLOWDOWN:
+            # With continuous collision detection nothing can pass
+            # through barriers -> one exact step per drawing
+            update(1/game.fps)
+            check_for_win(world)
+
+        elif not SLOWDOWN:
             # Collision detection is not fully working with very
             # low fps (<< 10 fps)
             fps = max(game.fps, MIN_DRAW_FPS)
@@ -128,7 +219,7 @@ def run():
                 update(1/(fps * SIMULATION_FRAMES_PER_DRAW))
 
                 # Check for a possible game ending
-                sorted_scores, game_finish_time = check_for_win(win_area, sorted_scores, game_finish_time)
+                check_for_win(world)
 
         else:
             # SLOWDOWN can be set to true in order to observe the
@@ -138,4 +229,7 @@ def run():
             update(1/100)
 
         # 3. Draw (visualization)
-        draw()
+        draw(timestep.alpha if FIXED_TIMESTEP and not SLOWDOWN else 1)
+
+    if recorder is not None:
+        recorder.close()
@@ -0,0 +1,335 @@
+
+# Libraries
+import asyncio
+import random
+import struct
+import time
+
+# Constants
+from engine_v2.constants import *
+
+# Components
+from v7.replay import INPUT_BITS, world_checksum
+from v7.snapshot import snapshot, restore
+from v7.win_logic import check_for_win
+
+
+"""
+Rollback networking for the two-player game: Every player runs the full
+simulation on their own machine and only the inputs are sent over UDP.
+
+    world = create_seeded_world(seed)          # same seed on both sides
+    session = RollbackSession(world, local_player_index=0)
+    await session.connect(("0.0.0.0", 5000), ("192.168.0.2", 5000))
+    ...
+    session.advance(get_input(world.players[0]))   # every fixed step
+
+The local input is applied immediately. The input of the remote player
+is predicted (the same keys stay pressed). When the real input
+arrives and differs from the prediction, the world is restored to the
+snapshot of the first mispredicted step (see v7/snapshot.py) and all
+steps since are simulated again. Since the keys only change every few
+hundred steps, most steps do not need any rollback at all.
+
+Every packet contains all local inputs the other side has not confirmed
+yet, so lost packets do not need to be resent.
+
+Run "python -m v7.netplay" for a test with two peers on a lossy loopback.
+"""
+
+# The local simulation can be at most this many steps ahead of the last
+# confirmed remote input (= maximum rollback), otherwise it has to wait
+MAX_ROLLBACK_STEPS = 2 * PHYSICS_HZ
+
+# At most this many inputs are sent in one packet
+MAX_PACKET_INPUTS = 256
+
+# first step, number of remote inputs received (ack)
+PACKET_HEADER = struct.Struct("<II")
+
+
+# The input of a single player as 4 bits (same bits as in v7/replay.py)
+def get_input(player):
+    return sum(bit for direction, bit in INPUT_BITS.items() if player.keypressed[direction])
+
+
+def set_input(player, input_bits):
+    for direction, bit in INPUT_BITS.items():
+        player.keypressed[direction] = bool(input_bits & bit)
+
+
+class RollbackSession:
+
+    def __init__(self, world, local_player_index, hz=PHYSICS_HZ):
+        assert len(world.players) == 2, "Rollback sessions are only supported for two players"
+        self.world = world
+        self.local_player_index = local_player_index
+        self.remote_player_index = 1 - local_player_index
+        self.timedelta = 1 / hz
+
+        # The next step to be simulated
+        self.step = 0
+
+        # The inputs of both players (the list index is the step). The
+        # local inputs are known up to self.step, the remote inputs only
+        # up to the last packet
+        self.inputs = [[], []]
+
+        # The remote input that has been used for every simulated step
+        # (confirmed or predicted)
+        self.used_remote_inputs = []
+
+        # The state before every step that might have to be rolled back
+        self.snapshots = {}
+
+        # How many of our inputs the other side has received
+        self.remote_ack = 0
+
+        self.transport = None
+        self.remote_address = None
+
+        # Statistics
+        self.rollbacks = 0
+        self.resimulated_steps = 0
+        self.rollback_duration = 0
+        self.packets_sent = 0
+        self.packets_received = 0
+
+    @property
+    def confirmed_steps(self):
+        return len(self.inputs[self.remote_player_index])
+
+    # Opens the UDP socket (see also UnreliableTransport for testing)
+    async def connect(self, local_address, remote_address):
+        loop = asyncio.get_running_loop()
+        self.transport, protocol = await loop.create_datagram_endpoint(
+            lambda: NetplayProtocol(self), local_addr=local_address
+        )
+        self.remote_address = remote_address
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    # The prediction: The remote player keeps pressing the same keys
+    def get_remote_input(self, step):
+        remote_inputs = self.inputs[self.remote_player_index]
+        if step < len(remote_inputs):
+            return remote_inputs[step]
+        return remote_inputs[-1] if remote_inputs else 0
+
+    def can_advance(self):
+        return self.step - self.confirmed_steps < MAX_ROLLBACK_STEPS
+
+    def simulate_step(self, step):
+        # Only the snapshots of unconfirmed steps are needed
+        self.snapshots[step] = snapshot(self.world)
+
+        remote_input = self.get_remote_input(step)
+        if step < len(self.used_remote_inputs):
+            self.used_remote_inputs[step] = remote_input
+        else:
+            self.used_remote_inputs.append(remote_input)
+
+        players = self.world.players
+        set_input(players[self.local_player_index], self.inputs[self.local_player_index][step])
+        set_input(players[self.remote_player_index], remote_input)
+        self.world.update_all(self.timedelta)
+        check_for_win(self.world)
+
+    # Simulates the next step with the given local input (see get_input)
+    def advance(self, local_input):
+        assert self.can_advance(), "Too far ahead of the remote player, wait for the remote input"
+        self.inputs[self.local_player_index].append(local_input)
+        self.simulate_step(self.step)
+        self.step += 1
+        self.send_inputs()
+
+    def send_inputs(self):
+        if self.transport is None:
+            return
+        local_inputs = self.inputs[self.local_player_index]
+        start_step = self.remote_ack
+        packet = PACKET_HEADER.pack(start_step, self.confirmed_steps) + \
+            bytes(local_inputs[start_step:start_step + MAX_PACKET_INPUTS])
+        self.transport.sendto(packet, self.remote_address)
+        self.packets_sent += 1
+
+    def receive_packet(self, packet):
+        self.packets_received += 1
+        start_step, ack = PACKET_HEADER.unpack_from(packet)
+        self.remote_ack = max(self.remote_ack, ack)
+
+        remote_inputs = self.inputs[self.remote_player_index]
+        first_mispredicted_step = None
+        for i, remote_input in enumerate(packet[PACKET_HEADER.size:]):
+            step = start_step + i
+            if step != len(remote_inputs):
+                # Already received with an earlier packet
+                continue
+            remote_inputs.append(remote_input)
+            if step < self.step and self.used_remote_inputs[step] != remote_input and first_mispredicted_step is None:
+                first_mispredicted_step = step
+
+        if first_mispredicted_step is not None:
+            self.rollback(first_mispredicted_step)
+
+        # Confirmed steps can never be rolled back
+        for step in [step for step in self.snapshots if step < min(self.confirmed_steps, self.step)]:
+            del self.snapshots[step]
+
+    # Restores the state before the given step and simulates all the
+    # steps since with the corrected inputs
+    def rollback(self, step):
+        start_time = time.perf_counter()
+        restore(self.world, self.snapshots[step])
+        for resimulated_step in range(step, self.step):
+            self.simulate_step(resimulated_step)
+
+        self.rollbacks += 1
+        self.resimulated_steps += self.step - step
+        self.rollback_duration += time.perf_counter() - start_time
+
+
+class NetplayProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, session):
+        self.session = session
+
+    def datagram_received(self, data, address):
+        self.session.receive_packet(data)
+
+
+# Wraps a transport to simulate a bad network: Every packet is dropped
+# with the probability loss, the others arrive after latency (+- jitter)
+# seconds
+class UnreliableTransport:
+
+    def __init__(self, transport, latency=0.05, jitter=0.01, loss=0.1, seed=None):
+        self.transport = transport
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+
+    def sendto(self, data, address):
+        if self.random.random() < self.loss:
+            return
+        delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        asyncio.get_running_loop().call_later(delay, self.deliver, data, address)
+
+    def deliver(self, data, address):
+        # Packets still "on the way" when closing are lost
+        if not self.transport.is_closing():
+            self.transport.sendto(data, address)
+
+    def close(self):
+        self.transport.close()
+
+
+# Plays one side of a networked match in the regular window. Both sides
+# have to use the same seed, e.g.
+#   machine 1: run_netplay(0, ("0.0.0.0", 5000), ("machine-2", 5000), seed=1)
+#   machine 2: run_netplay(1, ("0.0.0.0", 5000), ("machine-1", 5000), seed=1)
+def run_netplay(local_player_index, local_address, remote_address, seed):
+    import pygame
+    import v7.main as main
+
+    async def play():
+        main.setup(seed=seed)
+        session = RollbackSession(main.world, local_player_index, hz=main.timestep.hz)
+        await session.connect(local_address, remote_address)
+        local_player = main.world.players[local_player_index]
+
+        while main.world.game_finish_time is None or (main.datetime.now() - main.world.game_finish_time).seconds < 8:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    session.close()
+                    main.game.exit()
+                if event.type in (pygame.KEYDOWN, pygame.KEYUP) and event.key in local_player.keymap:
+                    local_player.keypress(event.key, event.type == pygame.KEYDOWN)
+
+            # The keys are overwritten by every (re-)simulated step
+            local_input = get_input(local_player)
+            for i in range(main.timestep.advance(main.game.timedelta)):
+                if session.can_advance():
+                    session.advance(local_input)
+            set_input(local_player, local_input)
+
+            main.draw(main.timestep.alpha)
+
+            # Let asyncio receive the packets
+            await asyncio.sleep(0)
+
+    asyncio.run(play())
+
+
+if __name__ == '__main__':
+    # Test: Two peers on a loopback with latency and packet loss, each
+    # one controlling one player with random input. When all inputs are
+    # confirmed both worlds have to be exactly the same as a world that
+    # was simulated offline with the same inputs
+    from v7.headless import ScriptedInput
+    from v7.replay import create_seeded_world
+
+    seed = 7
+    steps = 5 * PHYSICS_HZ
+    inputs = ScriptedInput.random(steps, seed=seed, mean_press_steps=PHYSICS_HZ // 10)
+
+    def player_inputs(player_index):
+        return ScriptedInput([event for event in inputs.events if event[1] == player_index])
+
+    # Simulates one side in (about) real time
+    async def run_peer(session, input_source):
+        world = session.world
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        while session.step < steps:
+            if session.can_advance():
+                input_source.apply(session.step, world.players)
+                session.advance(get_input(world.players[session.local_player_index]))
+            await asyncio.sleep(max(0.0, start_time + session.step / PHYSICS_HZ - loop.time()))
+
+        # Keep sending until both sides have confirmed everything
+        while session.confirmed_steps < steps or session.remote_ack < steps:
+            session.send_inputs()
+            await asyncio.sleep(0.01)
+
+    async def test():
+        sessions = []
+        for player_index, port in ((0, 47001), (1, 47002)):
+            session = RollbackSession(create_seeded_world(seed), player_index)
+            await session.connect(("127.0.0.1", port), ("127.0.0.1", 47003 - port + 47000))
+            session.transport = UnreliableTransport(session.transport, latency=0.05, jitter=0.02, loss=0.1, seed=port)
+            sessions.append(session)
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*[
+            run_peer(session, player_inputs(session.local_player_index)) for session in sessions
+        ])
+        duration = time.perf_counter() - start_time
+        for session in sessions:
+            session.close()
+        return sessions, duration
+
+    sessions, duration = asyncio.run(test())
+
+    # The same inputs without any network
+    offline_world = create_seeded_world(seed)
+    inputs.reset()
+    for step in range(steps):
+        inputs.apply(step, offline_world.players)
+        offline_world.update_all(1 / PHYSICS_HZ)
+        check_for_win(offline_world)
+
+    checksums = [world_checksum(session.world) for session in sessions]
+    assert checksums == [world_checksum(offline_world)] * 2, "The peers are out of sync"
+
+    print(f"{steps} steps in {duration:.1f} s with 50 ms latency and 10 % packet loss, both peers in sync")
+    for session in sessions:
+        print(
+            f"  player {session.local_player_index + 1}: {session.packets_sent} packets sent, "
+            f"{session.rollbacks} rollbacks, {session.resimulated_steps / max(1, session.rollbacks):.1f} "
+            f"steps re-simulated per rollback, "
+            f"{session.rollback_duration / max(1, session.rollbacks) * 1000:.2f} ms per rollback"
+        )
@@ -1,7 +1,7 @@
 
 # Engine
 from engine_v2.sprite import Sprite
-from engine_v2.helpers import merge_into_list_dict, reduce_to_relevant_collisions, get_collision
+from engine_v2.helpers import get_collision, interpolate, CollisionRecord
 from engine_v2.tests import *
 
 # Constants
@@ -15,11 +15,21 @@ from v7.enemy import Enemy
 
 class Player:
 
-    # A list of all Player instances
-    instances = []
+    # No per-instance __dict__
+    __slots__ = (
+        "world", "starting_position", "position", "size", "velocity", "previous_position",
+        "lifes_left", "enemies_killed", "old_corpses", "won", "score",
+        "keymap", "keypressed", "name", "color",
+        "sprite_run", "sprite_jump_up", "sprite_jump_down", "collisions"
+    )
 
+    # Reused for every collision detection (players are updated one
+    # after another, so they can all share it)
+    collision_record = CollisionRecord()
+
+    # world is the World (v7/world.py) this player belongs to
     def __init__(
-            self,
+            self, world,
             name,
             color=(0, 0, 0),
             position=(0, 0),
@@ -39,11 +49,16 @@ class Player:
 
         # All properties as lists with length 2
         # => [x-component, y-component]
+        # position and velocity are always updated in place
         self.starting_position = list(position)
         self.position = [p for p in position]  # manual deepcopy
         self.size = list(size)
         self.velocity = [0.0, 0.0]
 
+        # The position before the last update (used to interpolate
+        # the drawing position between two simulation frames)
+        self.previous_position = list(position)
+
         # Game specific stuff
         self.lifes_left = 3
         self.enemies_killed = 0
@@ -90,8 +105,10 @@ class Player:
             'OBJECTS_ON_TOP': []
         }
 
-        # Add this new instances to the instance-list from above
-        Player.instances.append(self)
+        # Add this new instances to the player-list and sweep of its world
+        self.world = world
+        world.players.append(self)
+        world.player_sweep.insert(self)
 
     def keypress(self, event_key, keydown):
         # We know from self.keymap which event.key will lead to which
@@ -107,7 +124,7 @@ class Player:
 
         # 1. Detect combat collisions with enemies. "MOVING_OBJECT"
         #    refers to the player. "BARRIER" refers to the enemy.
-        combat_collisions = Enemy.detect_all_collisions(self)
+        combat_collisions = Enemy.detect_all_collisions(self, record=Player.collision_record.reset())
         for enemy in combat_collisions['BARRIER_KILLED']:
             enemy.kill()
             self.enemies_killed += 1
@@ -119,13 +136,12 @@ class Player:
         #    players. Collisions should refer to the new velocity
         #    and new position that is why we preliminarily update
         #    the players state (self.)
-        self.velocity, self.position = new_velocity, new_position
-        movement_collisions = reduce_to_relevant_collisions(
-            merge_into_list_dict(
-                Barrier.detect_all_collisions(self),
-                Player.detect_all_collisions(self)
-            )
-        )
+        start_position = list(self.position) if self.world.continuous_collisions else None
+        self.velocity[:] = new_velocity
+        self.position[:] = new_position
+        movement_collisions = Player.collision_record.reset()
+        Barrier.detect_all_collisions(self, start_position=start_position, record=movement_collisions)
+        Player.detect_all_collisions(self, record=movement_collisions)
 
         # The strategy now is to go through all the collisions that
         # were detected and successively adjust new_velocity and
@@ -138,7 +154,7 @@ class Player:
             'FLOOR': None,
             'LEFT_WALL': None,
             'RIGHT_WALL': None,
-            'OBJECTS_ON_TOP': movement_collisions['OBJECTS_ON_TOP'],
+            'OBJECTS_ON_TOP': list(movement_collisions['OBJECTS_ON_TOP']),
         }
 
         # "Snap" to Wall/Floor/Ceiling when hitting one. Example
@@ -193,8 +209,10 @@ class Player:
         #    with collisions -> player state will be updated with the adjusted
         #    values
         self.collisions = new_collisions
-        self.velocity = [round(v, COORDINATE_PRECISION) for v in new_velocity]
-        self.position = [round(p, COORDINATE_PRECISION) for p in new_position]
+        self.velocity[0] = round(new_velocity[0], COORDINATE_PRECISION)
+        self.velocity[1] = round(new_velocity[1], COORDINATE_PRECISION)
+        self.position[0] = round(new_position[0], COORDINATE_PRECISION)
+        self.position[1] = round(new_position[1], COORDINATE_PRECISION)
 
     # Update a single Player instances
     def update(self, timedelta):
@@ -264,24 +282,30 @@ class Player:
         self.calculate_score()
 
 
-    # Update all Player instances
+    # Update all Player instances of a world
     @staticmethod
-    def update_all(timedelta):
-        for player in Player.instances:
+    def update_all(world, timedelta):
+        for player in world.players:
+            player.previous_position[:] = player.position
             if player.lifes_left > 0 and not player.won:
                 player.update(timedelta)
 
-    # Draw a single Player instances
-    def draw(self, game):
+                # Keep the broadphase sorted for the following players
+                world.player_sweep.move(player)
+
+    # Draw a single Player instances. alpha is the time between the last
+    # and the next simulation frame (see engine_v2/timestep.py)
+    def draw(self, game, alpha=1):
         if self.lifes_left > 0:
             # Draw the sprite using the draw_sprite_rect method from the Game class
+            position = interpolate(self.previous_position, self.position, alpha)
 
             if self.velocity[1] > ERROR_MARGIN:
                 # When jumping and velocity is upwards
                 self.sprite_run.reset()
                 game.draw_sprite_element(
                     self.sprite_jump_up.getImage(),
-                    center_position=self.position,
+                    center_position=position,
                     sprite_offset=[0, 0.55]
                 )
             elif self.velocity[1] < - ERROR_MARGIN:
@@ -289,14 +313,14 @@ class Player:
                 self.sprite_run.reset()
                 game.draw_sprite_element(
                     self.sprite_jump_down.getImage(),
-                    center_position=self.position,
+                    center_position=position,
                     sprite_offset=[0, 0.45]
                 )
             else:
                 # When on some floor (y-velocity = 0)
                 game.draw_sprite_element(
                     self.sprite_run.getImage(),
-                    center_position=self.position,
+                    center_position=position,
                     sprite_offset=[0, 0.45]
                 )
 
@@ -309,11 +333,11 @@ class Player:
             for corpse in self.old_corpses:
                 game.draw_rect_element(corpse, self.size, color=self.color, alpha=0.3)
 
-    # Draw all Player instances
+    # Draw all Player instances of a world
     @staticmethod
-    def draw_all(game):
-        for player in Player.instances:
-            player.draw(game)
+    def draw_all(world, game, alpha=1):
+        for player in world.players:
+            player.draw(game, alpha)
 
     def kill(self):
         # "kill" moves the player to its starting position and
@@ -321,7 +345,7 @@ class Player:
         # that, the position-of-death will be appended to the
         # self.corpses array in order to draw old corpses on the
         # screen
-        self.old_corpses.append(self.position)
+        self.old_corpses.append(list(self.position))
         self.lifes_left -= 1
         self.collisions = {
             'CEILING': None,
@@ -330,34 +354,24 @@ class Player:
             'RIGHT_WALL': None,
             'OBJECTS_ON_TOP': []
         }
-        self.velocity = [0, 0]
-        self.position = [p for p in self.starting_position]
+        self.velocity[:] = [0, 0]
+        self.position[:] = self.starting_position
+        self.previous_position[:] = self.starting_position
 
     # The method used by a player (=moving_player) to detect all
-    # collisions with other players from the Player.instances list
+    # collisions with the other players of its world (added to
+    # record, a CollisionRecord)
     @staticmethod
-    def detect_all_collisions(moving_player):
-        # 1. Fetch all possiple collisions
-        all_collisions = {
-            'FLOOR': [],
-            'OBJECTS_ON_TOP': [],
-            'OBJECTS_BELOW': [],
-            'LEFT_WALL': [],
-            'RIGHT_WALL': [],
-        }
+    def detect_all_collisions(moving_player, record=None):
+        if record is None:
+            record = CollisionRecord()
 
-        for player in Player.instances:
+        # Only the players overlapping on the x-axis can collide
+        for player in moving_player.world.player_sweep.query(moving_player.position, moving_player.size):
             if player != moving_player and player.lifes_left > 0:
-                collision = get_collision(barrier=player, moving_object=moving_player, stacked_collision=True)
-                all_collisions = merge_into_list_dict(
-                    all_collisions,
-                    collision
-                )
+                get_collision(barrier=player, moving_object=moving_player, stacked_collision=True, record=record)
 
-        # 2. Reduce all collisions to the relevant ones, example:
-        #    all_collisions['FLOOR'] = [3.0, 4.2, 2.2, 4.0]
-        #    -> relevant_collisions['FLOOR'] = 4.2
-        return reduce_to_relevant_collisions(all_collisions)
+        return record
 
     # Calculate this current score of the player
     # The current height only comes into play, when the players
@@ -370,3 +384,27 @@ class Player:
         else:
             score = 0
         self.score = score
+
+
+if __name__ == '__main__':
+    # Test: A player running (10 m/s) towards a 0.1 meter thin barrier at
+    # 5 FPS moves 2 meters per frame. Without continuous collision
+    # detection the player tunnels through the barrier, with it the player
+    # stops in front of it
+    from v7.world import World
+    import v7.graphics as graphics
+
+    for continuous in (False, True):
+        world = World(continuous_collisions=continuous)
+        Barrier(world, x_left=-5, y_top=0, width=30, height=10)  # thick floor
+        barrier = Barrier(world, x_center=5.0, y_top=4, width=0.1, height=4)
+        player = Player(world, "Test", position=(0, 0.8), **graphics.get_player_sprites(0))
+        player.keypressed['RIGHT'] = True
+        for frame in range(10):
+            Player.update_all(world, 1/5)
+
+        print(f"continuous={continuous}: player ends at x={player.position[0]:.4f} (barrier at x=4.95 to x=5.05)")
+        if continuous:
+            assert player.position[0] < barrier.position[0], "Player tunneled through the barrier"
+        else:
+            assert player.position[0] > barrier.position[0], "Expected the player to tunnel without sweeping"
@@ -0,0 +1,260 @@
+
+# Libraries
+import hashlib
+import random
+import struct
+import time
+from array import array
+
+# Constants
+from engine_v2.constants import *
+
+# Components
+from v7.win_logic import check_for_win
+
+
+"""
+Records the input of a match so that it can be replayed bit for bit.
+
+A match only depends on the seed (all randomness comes from random,
+which is seeded before the world is created), on the fixed timestep and
+on the keys pressed in every step. A replay file contains exactly that:
+
+    header:  b"V7RP", format version, seed, hz, player count
+    body:    runs of (varint step count, input bytes)
+
+The input of a step is 4 bits per player (UP, LEFT, DOWN, RIGHT), so
+two players fit into one byte. Since the keys only change every few
+hundred steps, consecutive equal steps are stored as one run - a minute
+of game time only takes a few kB. Runs are written as soon as the
+input changes, so a replay can be streamed while the match is running.
+
+    with ReplayRecorder(path, seed, player_count=2) as recorder:
+        ...  # recorder.record(world.players) before every fixed step
+
+    stats = replay(path)
+
+Run "python -m v7.replay" for a test and a benchmark.
+"""
+
+REPLAY_MAGIC = b"V7RP"
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct("<4sBQHB")
+
+# The bit of every direction in a player's 4 input bits
+INPUT_BITS = {'UP': 1, 'LEFT': 2, 'DOWN': 4, 'RIGHT': 8}
+
+
+# Input bytes of one step for all players (4 bits per player)
+def encode_input(players):
+    mask = 0
+    for player_index, player in enumerate(players):
+        for direction, bit in INPUT_BITS.items():
+            if player.keypressed[direction]:
+                mask |= bit << (4 * player_index)
+    return mask.to_bytes((len(players) + 1) // 2, "little")
+
+
+# Sets the keys of all players to the input bytes of one step
+def decode_input(input_bytes, players):
+    mask = int.from_bytes(input_bytes, "little")
+    for player_index, player in enumerate(players):
+        for direction, bit in INPUT_BITS.items():
+            player.keypressed[direction] = bool(mask & (bit << (4 * player_index)))
+
+
+# Unsigned LEB128 (7 bits per byte, the highest bit marks a following byte)
+# appended to a bytearray, also used by the delta states of v7/delta.py
+def write_varint(buffer, value):
+    while value > 0x7f:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(file):
+    value, shift = 0, 0
+    while True:
+        byte = file.read(1)
+        if not byte:
+            # End of the file (only allowed before the first byte)
+            assert shift == 0, "File is truncated"
+            return None
+        value |= (byte[0] & 0x7f) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7
+
+
+# A hash over the state of all moving objects of a world. Two worlds with
+# the same checksum have been simulated bit for bit identically. All
+# values are hashed as doubles, so 0 and 0.0 are the same
+def world_checksum(world):
+    values = []
+    for enemy in world.enemies:
+        values += enemy.position
+        values += enemy.velocity
+    for player in world.players:
+        values += player.position
+        values += player.velocity
+        values += (player.lifes_left, player.enemies_killed)
+
+    h = hashlib.blake2b(array("d", values).tobytes(), digest_size=8)
+    if world.enemy_swarm is not None:
+        h.update(world.enemy_swarm.positions[:len(world.enemy_swarm)].tobytes())
+    return h.hexdigest()
+
+
+class ReplayRecorder:
+
+    # file can be a path or a binary file object (e.g. a socket file)
+    def __init__(self, file, seed, hz=PHYSICS_HZ, player_count=2):
+        assert 0 <= seed < 2 ** 64, "The seed has to be an unsigned 64 bit integer"
+        self.own_file = isinstance(file, str)
+        self.file = open(file, "wb") if self.own_file else file
+        self.file.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, seed, hz, player_count))
+
+        self.seed = seed
+        self.hz = hz
+        self.player_count = player_count
+        self.steps = 0
+
+        # The current run of equal inputs
+        self.run_input = None
+        self.run_length = 0
+
+    # Call this once before every fixed step with the players of the world
+    def record(self, players):
+        assert len(players) == self.player_count, "Wrong number of players"
+        input_bytes = encode_input(players)
+        if input_bytes != self.run_input:
+            self.write_run()
+            self.run_input = input_bytes
+        self.run_length += 1
+        self.steps += 1
+
+    def write_run(self):
+        if self.run_length > 0:
+            data = bytearray()
+            write_varint(data, self.run_length)
+            self.file.write(data + self.run_input)
+            self.file.flush()
+        self.run_length = 0
+
+    def close(self):
+        self.write_run()
+        if self.own_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ReplayReader:
+
+    # file can be a path or a binary file object
+    def __init__(self, file):
+        self.own_file = isinstance(file, str)
+        self.file = open(file, "rb") if self.own_file else file
+
+        magic, version, self.seed, self.hz, self.player_count = REPLAY_HEADER.unpack(
+            self.file.read(REPLAY_HEADER.size)
+        )
+        assert magic == REPLAY_MAGIC, "Not a replay file"
+        assert version == REPLAY_VERSION, f"Unsupported replay version {version}"
+        self.input_size = (self.player_count + 1) // 2
+
+    # Yields the input bytes of every step (reads the file lazily)
+    def __iter__(self):
+        while True:
+            run_length = read_varint(self.file)
+            if run_length is None:
+                return
+            input_bytes = self.file.read(self.input_size)
+            assert len(input_bytes) == self.input_size, "Replay file is truncated"
+            for i in range(run_length):
+                yield input_bytes
+
+    def close(self):
+        if self.own_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# Creates the world of a match the same way every time (kwargs are
+# passed on to v7.main.create_world)
+def create_seeded_world(seed, **kwargs):
+    import v7.main as main
+    random.seed(seed)
+    return main.create_world(**kwargs)
+
+
+# Replays a recorded match headless (as fast as possible) and returns
+# some statistics including the checksum of the final state
+def replay(file):
+    with ReplayReader(file) as reader:
+        world = create_seeded_world(reader.seed)
+        assert len(world.players) == reader.player_count, "The replay has a different number of players"
+        timedelta = 1 / reader.hz
+
+        start_time = time.perf_counter()
+        step = 0
+        for input_bytes in reader:
+            decode_input(input_bytes, world.players)
+            world.update_all(timedelta)
+            check_for_win(world)
+            step += 1
+        duration = time.perf_counter() - start_time
+
+    return {
+        "steps": step,
+        "simulated_seconds": step * timedelta,
+        "duration": duration,
+        "steps_per_second": step / duration if duration > 0 else float("inf"),
+        "checksum": world_checksum(world),
+        "sorted_scores": world.sorted_scores,
+    }
+
+
+if __name__ == '__main__':
+    # Test: Recording a match with random input and replaying it has to
+    # lead to exactly the same final state. Benchmark: replay speed and
+    # size of the replay file
+    import io
+    from v7.headless import ScriptedInput
+
+    steps = 60 * PHYSICS_HZ
+    seed = 12345
+
+    # 1. Record
+    world = create_seeded_world(seed)
+    inputs = ScriptedInput.random(steps, seed=seed)
+    replay_file = io.BytesIO()
+    recorder = ReplayRecorder(replay_file, seed)
+    for step in range(steps):
+        inputs.apply(step, world.players)
+        recorder.record(world.players)
+        world.update_all(1 / PHYSICS_HZ)
+        check_for_win(world)
+    recorder.write_run()
+    recorded_checksum = world_checksum(world)
+
+    # 2. Replay
+    replay_file.seek(0)
+    stats = replay(replay_file)
+    assert stats["steps"] == steps, "Wrong number of steps"
+    assert stats["checksum"] == recorded_checksum, "Replay differs from the recorded match"
+
+    print(
+        f"{steps} steps ({stats['simulated_seconds']:.0f} s game time) in {len(replay_file.getvalue())} bytes, "
+        f"replayed bit for bit at {stats['steps_per_second']:.0f} steps/s "
+        f"({stats['steps_per_second'] / PHYSICS_HZ:.1f}x real time)"
+    )
@@ -0,0 +1,372 @@
+
+# Libraries
+import asyncio
+import collections
+import random
+import struct
+import time
+import zlib
+
+# Engine
+from engine_v2.timestep import FixedTimestep
+
+# Constants
+from engine_v2.constants import *
+
+# Components
+from v7.delta import DeltaEncoder, DeltaDecoder
+from v7.replay import create_seeded_world
+from v7.win_logic import check_for_win
+
+
+"""
+An authoritative match server hosting many rooms of the game at once.
+Every room has its own world (see v7/world.py), all rooms are simulated
+on one asyncio loop:
+
+    asyncio.run(serve("0.0.0.0", 6000))
+
+Clients connect via TCP, join a room by its name and get one of the two
+players of that room. They only send their key presses, the server
+sends back the state of the world after every server tick. A state only
+contains what has changed since the last state the client acknowledged
+(see v7/delta.py).
+
+Messages (each one prefixed with its length as uint16):
+    client -> server    b"J" + room name            join a room
+                        b"K" + direction + pressed  key event (2 bytes)
+                        b"A" + sequence (uint32)    state acknowledged
+    server -> client    b"W" + player index + seed  welcome
+                        b"S" + state                see DeltaEncoder
+
+With processes > 1, run_server starts one server process per core on the
+ports port, port + 1, ... Clients find the process of a room with
+shard_port(room_name, port, processes).
+
+Every room measures how long its ticks take, see Server.room_stats().
+
+Malformed messages close the connection. Clients that do not read their
+states fast enough are skipped until their send buffer has drained (the
+next state is a delta to the last acknowledged one anyway).
+
+Run "python -m v7.server" for a test with scripted bot clients.
+"""
+
+# The server simulates all rooms and sends their states this many times
+# per second (every tick covers PHYSICS_HZ / SERVER_TICK_HZ fixed steps)
+SERVER_TICK_HZ = 60
+
+DIRECTIONS = ('UP', 'LEFT', 'DOWN', 'RIGHT')
+
+# The tick statistics only cover the last minute, and only the ones of
+# the last MAX_CLOSED_ROOM_STATS closed rooms are kept
+STATS_WINDOW = 60 * SERVER_TICK_HZ
+MAX_CLOSED_ROOM_STATS = 100
+
+# No state is sent to a client while more than this many bytes are still
+# waiting to be sent to it
+MAX_WRITE_BUFFER_SIZE = 256 * 1024
+
+MESSAGE_LENGTH = struct.Struct("<H")
+WELCOME = struct.Struct("<BQ")
+ACK = struct.Struct("<I")
+
+
+async def read_message(reader):
+    length, = MESSAGE_LENGTH.unpack(await reader.readexactly(MESSAGE_LENGTH.size))
+    return await reader.readexactly(length)
+
+
+def write_message(writer, message):
+    writer.write(MESSAGE_LENGTH.pack(len(message)) + message)
+
+
+# The stable process of a room when running with several processes
+def shard_port(room_name, port, processes):
+    return port + zlib.crc32(room_name.encode()) % processes
+
+
+class Room:
+
+    def __init__(self, name, seed):
+        self.name = name
+
+        # The name of the room in Server.tick_durations
+        self.stats_name = name
+        self.seed = seed
+
+        # A room can stay open for hours, so its enemies get an endless
+        # noise that never repeats (see PerlinNoiseStream)
+        self.world = create_seeded_world(seed, noise_stream=True)
+        self.tick = 0
+
+        # player index -> (writer, DeltaEncoder)
+        self.clients = {}
+
+        # Seconds per tick (simulation + encoding the states)
+        self.tick_durations = collections.deque(maxlen=STATS_WINDOW)
+
+        # States not sent because the client was too slow
+        self.skipped_states = 0
+
+    def join(self, writer):
+        free_players = [i for i in range(len(self.world.players)) if i not in self.clients]
+        if not free_players:
+            return None
+        self.clients[free_players[0]] = (writer, DeltaEncoder())
+        return free_players[0]
+
+    def leave(self, player_index):
+        self.clients.pop(player_index, None)
+
+    def keypress(self, player_index, direction, pressed):
+        self.world.players[player_index].keypressed[direction] = pressed
+
+    def ack(self, player_index, sequence):
+        if player_index in self.clients:
+            self.clients[player_index][1].ack(sequence)
+
+    def update(self, steps, timedelta):
+        start_time = time.perf_counter()
+        if self.world.game_finish_time is None:
+            for step in range(steps):
+                self.world.update_all(timedelta)
+                check_for_win(self.world)
+        self.tick += 1
+
+        for writer, encoder in self.clients.values():
+            if writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER_SIZE:
+                self.skipped_states += 1
+                continue
+            write_message(writer, b"S" + encoder.encode(self.world, self.tick))
+        self.tick_durations.append(time.perf_counter() - start_time)
+
+
+class Server:
+
+    def __init__(self, seed=None):
+        self.rooms = {}
+        self.random = random.Random(seed)
+        self.timestep = FixedTimestep(hz=PHYSICS_HZ)
+
+        # The recent tick durations of every room (also of the rooms that
+        # have been closed in the meantime). A reused room name gets a
+        # new entry "name (2)", "name (3)" ...
+        self.tick_durations = {}
+        self.closed_rooms = collections.deque()
+
+        # Seconds the ticks started later than planned
+        self.tick_delays = collections.deque(maxlen=STATS_WINDOW)
+
+    async def handle_client(self, reader, writer):
+        room, player_index = None, None
+        try:
+            # The first message has to join a room
+            message = await read_message(reader)
+            if message[:1] != b"J":
+                return
+            try:
+                room_name = message[1:].decode()
+            except UnicodeDecodeError:
+                return
+            if room_name not in self.rooms:
+                self.open_room(room_name)
+            room = self.rooms[room_name]
+
+            player_index = room.join(writer)
+            if player_index is None:
+                # The room is full
+                return
+            write_message(writer, b"W" + WELCOME.pack(player_index, room.seed))
+
+            while True:
+                message = await read_message(reader)
+                if message[:1] == b"K" and len(message) == 3 and message[1] < len(DIRECTIONS) and message[2] <= 1:
+                    room.keypress(player_index, DIRECTIONS[message[1]], bool(message[2]))
+                elif message[:1] == b"A" and len(message) == 1 + ACK.size:
+                    room.ack(player_index, ACK.unpack(message[1:])[0])
+                else:
+                    # Malformed message
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if room is not None and player_index is not None:
+                room.leave(player_index)
+
+                # Rooms are closed when the last client has left
+                if not room.clients and self.rooms.get(room.name) is room:
+                    self.close_room(room)
+            writer.close()
+
+    def open_room(self, room_name):
+        room = Room(room_name, self.random.randrange(2 ** 64))
+        self.rooms[room_name] = room
+
+        stats_name, i = room_name, 1
+        while stats_name in self.tick_durations:
+            i += 1
+            stats_name = f"{room_name} ({i})"
+        room.stats_name = stats_name
+        self.tick_durations[stats_name] = room.tick_durations
+
+    def close_room(self, room):
+        del self.rooms[room.name]
+        self.closed_rooms.append(room.stats_name)
+        if len(self.closed_rooms) > MAX_CLOSED_ROOM_STATS:
+            del self.tick_durations[self.closed_rooms.popleft()]
+
+    # Simulates all rooms in (about) real time
+    async def tick_loop(self):
+        loop = asyncio.get_running_loop()
+        tick_time = 1 / SERVER_TICK_HZ
+        last_time = next_time = loop.time()
+        while True:
+            now = loop.time()
+            self.tick_delays.append(max(0.0, now - next_time))
+            steps = self.timestep.advance(now - last_time)
+            last_time = now
+
+            for room in list(self.rooms.values()):
+                room.update(steps, self.timestep.timedelta)
+
+            next_time += tick_time
+            if next_time < loop.time():
+                # Too slow: skip the missed ticks instead of piling them up
+                next_time = loop.time()
+            await asyncio.sleep(next_time - loop.time())
+
+    # Tick duration percentiles (in ms) of every room
+    def room_stats(self, percentiles=(50, 95, 99)):
+        stats = {}
+        for name, durations in self.tick_durations.items():
+            durations = sorted(durations)
+            if durations:
+                stats[name] = {
+                    f"p{p}": durations[min(len(durations) - 1, len(durations) * p // 100)] * 1000
+                    for p in percentiles
+                }
+        return stats
+
+
+async def serve(host, port, seed=None, server=None):
+    if server is None:
+        server = Server(seed)
+    tcp_server = await asyncio.start_server(server.handle_client, host, port)
+    async with tcp_server:
+        await asyncio.gather(tcp_server.serve_forever(), server.tick_loop())
+
+
+def run_shard(host, port, seed):
+    asyncio.run(serve(host, port, seed))
+
+
+# Runs processes server processes on the ports port, port + 1, ...
+def run_server(host, port, processes=1, seed=None):
+    if processes == 1:
+        run_shard(host, port, seed)
+        return
+
+    import multiprocessing
+    shards = [
+        multiprocessing.Process(
+            target=run_shard, args=(host, port + i, None if seed is None else seed + i), daemon=True
+        )
+        for i in range(processes)
+    ]
+    for shard in shards:
+        shard.start()
+    for shard in shards:
+        shard.join()
+
+
+# A client pressing random keys (see ScriptedInput.random) for duration
+# seconds. Returns the number of states and bytes received
+async def run_bot(host, port, room_name, duration, seed=None):
+    from v7.headless import ScriptedInput
+
+    reader, writer = await asyncio.open_connection(host, port)
+    write_message(writer, b"J" + room_name.encode())
+    welcome = await read_message(reader)
+    player_index, room_seed = WELCOME.unpack(welcome[1:])
+
+    decoder = DeltaDecoder()
+    received = {"states": 0, "bytes": 0}
+
+    async def receive_states():
+        while True:
+            message = await read_message(reader)
+            sequence = decoder.decode(message[1:])
+            if sequence is not None:
+                write_message(writer, b"A" + ACK.pack(sequence))
+            received["states"] += 1
+            received["bytes"] += len(message) + MESSAGE_LENGTH.size
+
+    receive_task = asyncio.create_task(receive_states())
+
+    # Send the key events in real time
+    events = ScriptedInput.random(round(duration * PHYSICS_HZ), player_count=1, seed=seed).events
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    for step, i, direction, pressed in events:
+        await asyncio.sleep(max(0.0, start_time + step / PHYSICS_HZ - loop.time()))
+        write_message(writer, b"K" + bytes([DIRECTIONS.index(direction), pressed]))
+    await asyncio.sleep(max(0.0, start_time + duration - loop.time()))
+
+    receive_task.cancel()
+    writer.close()
+    return {"player_index": player_index, **received, "players": decoder.players, "enemies": len(decoder.enemies)}
+
+
+if __name__ == '__main__':
+    # Test: 8 rooms with 2 bots each on the loopback. Prints the tick
+    # duration percentiles of some rooms and the bandwidth per client
+    room_count = 8
+    duration = 5
+    host, port = "127.0.0.1", 47100
+
+    async def test():
+        server = Server(seed=0)
+        server_task = asyncio.create_task(serve(host, port, server=server))
+        await asyncio.sleep(0.2)
+
+        bot_results = await asyncio.gather(*[
+            run_bot(host, port, f"room-{room}", duration, seed=2 * room + player)
+            for room in range(room_count) for player in range(2)
+        ])
+
+        # A closed room can be opened again (with its own stats), a
+        # malformed key event closes the connection
+        reader, writer = await asyncio.open_connection(host, port)
+        write_message(writer, b"J" + b"room-0")
+        await read_message(reader)
+        write_message(writer, b"K" + bytes([len(DIRECTIONS), 1]))
+        try:
+            while True:
+                await read_message(reader)
+        except asyncio.IncompleteReadError:
+            pass
+        writer.close()
+        await asyncio.sleep(0.1)
+
+        server_task.cancel()
+        return server, bot_results
+
+    server, bot_results = asyncio.run(test())
+
+    assert len(server.tick_durations) == room_count + 1, "Expected one room per pair of bots and a reopened room"
+    assert "room-0 (2)" in server.tick_durations, "Expected separate stats for the reopened room"
+    assert not server.rooms, "Expected all rooms to be closed"
+    assert all(sorted(result["players"]) == [0, 1] for result in bot_results), "Every bot should know both players"
+
+    delays = sorted(server.tick_delays)
+    print(
+        f"{room_count} rooms, {len(bot_results)} bots, {duration} s: tick delay "
+        f"p50 {delays[len(delays) // 2] * 1000:.2f} ms, p99 {delays[len(delays) * 99 // 100] * 1000:.2f} ms"
+    )
+    for name, stats in list(server.room_stats().items())[:4]:
+        print(f"  {name}: tick duration " + ", ".join(f"{p} {value:.3f} ms" for p, value in stats.items()))
+
+    states = sum(result["states"] for result in bot_results)
+    received_bytes = sum(result["bytes"] for result in bot_results)
+    print(f"  {received_bytes / states:.0f} bytes per state, {received_bytes / len(bot_results) / duration / 1000:.1f} kB/s per client")
@@ -0,0 +1,302 @@
+
+# Libraries
+import json
+import math
+import struct
+from array import array
+from datetime import datetime
+
+# Engine
+from engine_v2.sweep_and_prune import SweepAndPrune
+
+# Constants
+from engine_v2.constants import *
+
+
+"""
+Saves the complete state of a world as a compact binary snapshot and
+restores it later, e.g. for rollback, rewinding while debugging or to
+fork one state into many what-if simulations:
+
+    data = snapshot(world)
+    world.update_all(timedelta)    # ... simulate for a while
+    restore(world, data)           # back to the state from above
+
+Only the state that changes while the game is running is stored
+(positions, velocities, collisions, noise index/sign, sprite animation,
+lifes, corpses, keys, scores). Everything static (barriers, sizes, the
+noise itself, sprites) is not, so a snapshot can only be restored into
+the world it was taken from or into a world created the same way (same
+level and seed, see v7/replay.py). This also holds for an endless
+PerlinNoiseStream: its values only depend on its seed (discarded chunks
+are generated again), so the noise_index of an enemy is enough.
+
+Enemies are referenced by their enemy_id. Restoring an older snapshot
+brings back the enemies that have been killed in the meantime.
+
+Run "python -m v7.snapshot" for a test and a benchmark.
+"""
+
+SNAPSHOT_MAGIC = b"V7SS"
+SNAPSHOT_VERSION = 2
+
+# magic, version, enemy count, swarm enemy count, player count,
+# game_finish_time (nan = not finished), sorted_scores json length
+SNAPSHOT_HEADER = struct.Struct("<4sBIIBdI")
+
+# Per enemy: position (2), velocity (2), previous_position (2), noise_index,
+# noise_sign, collisions (4, nan = None), sprite index, sprite flip
+ENEMY_STRUCT = struct.Struct("<14d")
+
+# position (2), velocity (2), previous_position (2), collisions (4),
+# sprite indices (3), score, lifes_left, enemies_killed, flags (won, score
+# is float, sprites flipped, UP, LEFT, DOWN, RIGHT), objects on top count,
+# corpse count
+PLAYER_STRUCT = struct.Struct("<14diiBHH")
+
+SIDES = ('CEILING', 'FLOOR', 'LEFT_WALL', 'RIGHT_WALL')
+DIRECTIONS = ('UP', 'LEFT', 'DOWN', 'RIGHT')
+NAN = float("nan")
+
+
+def to_double(value):
+    return NAN if value is None else value
+
+
+def from_double(value):
+    return None if math.isnan(value) else value
+
+
+def snapshot(world):
+    enemies = world.enemies
+    players = world.players
+    swarm = world.enemy_swarm
+    swarm_count = 0 if swarm is None else len(swarm)
+
+    scores = json.dumps(world.sorted_scores).encode()
+    finish_time = NAN if world.game_finish_time is None else world.game_finish_time.timestamp()
+    parts = [
+        SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(enemies), swarm_count, len(players), finish_time, len(scores)
+        ),
+        scores
+    ]
+
+    # 1. Enemies: All ids first, then the values of every enemy
+    parts.append(array("I", [enemy.enemy_id for enemy in enemies]).tobytes())
+    pack = ENEMY_STRUCT.pack
+    for enemy in enemies:
+        collisions = enemy.collisions
+        ceiling, floor = collisions['CEILING'], collisions['FLOOR']
+        left_wall, right_wall = collisions['LEFT_WALL'], collisions['RIGHT_WALL']
+        parts.append(pack(
+            *enemy.position, *enemy.velocity, *enemy.previous_position, enemy.noise_index, enemy.noise_sign,
+            NAN if ceiling is None else ceiling, NAN if floor is None else floor,
+            NAN if left_wall is None else left_wall, NAN if right_wall is None else right_wall,
+            enemy.sprite.index, enemy.sprite.flip[0]
+        ))
+
+    # 2. Players (objects on top are stored as indices in world.players)
+    for player in players:
+        flags = (
+            player.won | (isinstance(player.score, float) << 1) | (bool(player.sprite_run.flip[0]) << 2) |
+            sum(player.keypressed[direction] << (3 + i) for i, direction in enumerate(DIRECTIONS))
+        )
+        objects_on_top = [players.index(_object) for _object in player.collisions['OBJECTS_ON_TOP']]
+        parts.append(PLAYER_STRUCT.pack(
+            *player.position, *player.velocity, *player.previous_position,
+            *[to_double(player.collisions[side]) for side in SIDES],
+            player.sprite_run.index, player.sprite_jump_up.index, player.sprite_jump_down.index, player.score,
+            player.lifes_left, player.enemies_killed, flags, len(objects_on_top), len(player.old_corpses)
+        ))
+        parts.append(array("H", objects_on_top).tobytes())
+        parts.append(array("d", [c for corpse in player.old_corpses for c in corpse]).tobytes())
+
+    # 3. Swarm enemies: The used rows of all arrays
+    if swarm_count > 0:
+        for name in type(swarm).ARRAY_NAMES:
+            parts.append(getattr(swarm, name)[:swarm_count].tobytes())
+
+    return b"".join(parts)
+
+
+def restore(world, data):
+    magic, version, enemy_count, swarm_count, player_count, finish_time, scores_length = \
+        SNAPSHOT_HEADER.unpack_from(data)
+    assert magic == SNAPSHOT_MAGIC, "Not a snapshot"
+    assert version == SNAPSHOT_VERSION, f"Unsupported snapshot version {version}"
+    assert player_count == len(world.players), "The snapshot belongs to a world with a different number of players"
+    offset = SNAPSHOT_HEADER.size
+
+    world.sorted_scores = json.loads(data[offset:offset + scores_length])
+    world.game_finish_time = None if math.isnan(finish_time) else datetime.fromtimestamp(finish_time)
+    offset += scores_length
+
+    # 1. Enemies: Bring back the enemies that have been killed since
+    #    (and remove the ones created since). The broadphase only has
+    #    to be rebuilt when the enemies have changed
+    enemy_ids = array("I")
+    enemy_ids.frombytes(data[offset:offset + 4 * enemy_count])
+    offset += 4 * enemy_count
+    enemies = [world.all_enemies[enemy_id] for enemy_id in enemy_ids]
+    if enemies != world.enemies:
+        world.enemies[:] = enemies
+        world.enemy_sweep = SweepAndPrune()
+        for enemy in enemies:
+            world.enemy_sweep.insert(enemy)
+
+    # nan is the only value that is not equal to itself (nan = None)
+    for enemy, values in zip(enemies, ENEMY_STRUCT.iter_unpack(data[offset:offset + ENEMY_STRUCT.size * enemy_count])):
+        (
+            enemy.position[0], enemy.position[1], enemy.velocity[0], enemy.velocity[1],
+            enemy.previous_position[0], enemy.previous_position[1], enemy.noise_index, noise_sign,
+            ceiling, floor, left_wall, right_wall, enemy.sprite.index, flip
+        ) = values
+        enemy.noise_sign = int(noise_sign)
+        enemy.collisions = {
+            'CEILING': ceiling if ceiling == ceiling else None, 'FLOOR': floor if floor == floor else None,
+            'LEFT_WALL': left_wall if left_wall == left_wall else None,
+            'RIGHT_WALL': right_wall if right_wall == right_wall else None
+        }
+        enemy.sprite.flip = (bool(flip), False)
+    offset += ENEMY_STRUCT.size * enemy_count
+    world.enemy_sweep.update()
+
+    # 2. Players
+    players = world.players
+    for player in players:
+        values = PLAYER_STRUCT.unpack_from(data, offset)
+        offset += PLAYER_STRUCT.size
+        player.position[:] = values[0:2]
+        player.velocity[:] = values[2:4]
+        player.previous_position[:] = values[4:6]
+        player.sprite_run.index, player.sprite_jump_up.index, player.sprite_jump_down.index = values[10:13]
+        score, player.lifes_left, player.enemies_killed, flags, on_top_count, corpse_count = values[13:]
+
+        player.won = bool(flags & 1)
+        player.score = score if flags & 2 else int(score)
+        flip = (bool(flags & 4), False)
+        for sprite in (player.sprite_run, player.sprite_jump_up, player.sprite_jump_down):
+            sprite.flip = flip
+        for i, direction in enumerate(DIRECTIONS):
+            player.keypressed[direction] = bool(flags & (1 << (3 + i)))
+
+        objects_on_top = array("H")
+        objects_on_top.frombytes(data[offset:offset + 2 * on_top_count])
+        offset += 2 * on_top_count
+        player.collisions = {
+            **{side: from_double(value) for side, value in zip(SIDES, values[6:10])},
+            'OBJECTS_ON_TOP': [players[i] for i in objects_on_top]
+        }
+
+        corpses = array("d")
+        corpses.frombytes(data[offset:offset + 16 * corpse_count])
+        offset += 16 * corpse_count
+        player.old_corpses = [list(corpses[i:i + 2]) for i in range(0, len(corpses), 2)]
+    world.player_sweep.update()
+
+    # 3. Swarm enemies
+    swarm = world.enemy_swarm
+    if swarm is not None:
+        from v7.enemy_swarm import SwarmEnemy
+        import numpy as np
+
+        while len(swarm.positions) < swarm_count:
+            swarm.grow()
+        for name in type(swarm).ARRAY_NAMES:
+            old_array = getattr(swarm, name)
+            row_shape = old_array.shape[1:]
+            row_count = swarm_count * (math.prod(row_shape) if row_shape else 1)
+            size = row_count * old_array.itemsize
+            old_array[:swarm_count] = np.frombuffer(data, dtype=old_array.dtype, count=row_count, offset=offset) \
+                .reshape((swarm_count,) + row_shape)
+            offset += size
+
+        # One view-object for every used row
+        del swarm.enemies[swarm_count:]
+        for i, enemy in enumerate(swarm.enemies):
+            enemy.index = i
+        for i in range(len(swarm.enemies), swarm_count):
+            swarm.enemies.append(SwarmEnemy(swarm, i))
+        swarm.count = swarm_count
+    else:
+        assert swarm_count == 0, "The snapshot contains swarm enemies but the world has no swarm"
+
+    assert offset == len(data), "Snapshot has the wrong length"
+
+
+if __name__ == '__main__':
+    # Test: Simulating after restoring a snapshot leads to exactly the
+    # same state as simulating straight on. Benchmark: snapshot size and
+    # round trip time for many enemies (Enemy objects and, if NumPy is
+    # installed, swarm enemies)
+    import random
+    import time
+    from v7.enemy import Enemy
+    from v7.replay import create_seeded_world, world_checksum
+
+    backends = ["objects"]
+    try:
+        from v7.enemy_swarm import EnemySwarm
+        backends.append("swarm")
+    except ImportError:
+        pass
+
+    # Enemies with a PerlinNoiseStream, restored after the chunks they
+    # need have been discarded (as in a long running simulation)
+    world = create_seeded_world(0, noise_stream=True)
+    data = snapshot(world)
+    for step in range(100):
+        world.update_all(1 / PHYSICS_HZ)
+    expected_checksum = world_checksum(world)
+
+    restore(world, data)
+    for enemy in world.enemies:
+        for chunk_index in range(1, enemy.noise.max_chunks + 1):
+            enemy.noise[chunk_index * enemy.noise.chunk_width]
+        assert 0 not in enemy.noise.chunks, "Expected the first chunk to be discarded"
+    for step in range(100):
+        world.update_all(1 / PHYSICS_HZ)
+    assert world_checksum(world) == expected_checksum, "Simulation with noise streams differs after restoring"
+
+    for backend in backends:
+        for enemy_count in (10, 1000, 10000):
+            world = create_seeded_world(0)
+            if backend == "swarm":
+                world.enemy_swarm = EnemySwarm(world)
+            for i in range(enemy_count - len(world.enemies)):
+                position = (random.uniform(1, 48), random.uniform(2, 18))
+                if backend == "swarm":
+                    world.enemy_swarm.spawn(position=position)
+                else:
+                    Enemy(world, position=position)
+            world.players[0].keypressed['RIGHT'] = True
+            for step in range(30):
+                world.update_all(1 / PHYSICS_HZ)
+
+            data = snapshot(world)
+            for step in range(100):
+                world.update_all(1 / PHYSICS_HZ)
+            expected_checksum = world_checksum(world)
+
+            restore(world, data)
+            assert snapshot(world) == data, "Restoring changed the snapshot"
+            for step in range(100):
+                world.update_all(1 / PHYSICS_HZ)
+            assert world_checksum(world) == expected_checksum, "Simulation differs after restoring"
+
+            repetitions = max(1, 10000 // enemy_count)
+            start_time = time.perf_counter()
+            for i in range(repetitions):
+                data = snapshot(world)
+            snapshot_duration = (time.perf_counter() - start_time) / repetitions
+            start_time = time.perf_counter()
+            for i in range(repetitions):
+                restore(world, data)
+            restore_duration = (time.perf_counter() - start_time) / repetitions
+
+            swarm_count = 0 if world.enemy_swarm is None else len(world.enemy_swarm)
+            print(
+                f"{backend:>8} {len(world.enemies) + swarm_count:>6} enemies: {len(data):>8} bytes, "
+                f"snapshot {snapshot_duration * 1e6:8.0f} us, restore {restore_duration * 1e6:8.0f} us"
+            )
@@ -0,0 +1,308 @@
+
+# Libraries
+import multiprocessing
+import numpy as np
+
+# Constants
+from engine_v2.constants import *
+
+# Components
+from v7.netplay import set_input
+from v7.replay import create_seeded_world
+from v7.snapshot import snapshot, restore
+from v7.win_logic import check_for_win
+
+
+"""
+A vectorized environment (in the style of gymnasium.vector) for
+training bots: num_envs headless worlds are stepped at once.
+
+    env = VecEnv(num_envs=64)
+    observations, infos = env.reset(seeds=range(64))
+    while True:
+        actions = policy(observations)      # (num_envs, controlled_players)
+        observations, rewards, terminated, truncated, infos = env.step(actions)
+
+An action is the 4 bit input of a player (1 = UP, 2 = LEFT, 4 = DOWN,
+8 = RIGHT, see v7/replay.py), every action is held for steps_per_action
+simulation steps. The first controlled_players players of every world
+are controlled by the actions, the others do not move.
+
+The observations are NumPy arrays:
+    players   (num_envs, players, 8)   x, y, velocity_x, velocity_y,
+                                       lifes_left, enemies_killed, score, won
+    enemies   (num_envs, enemies, 5)   x, y, velocity_x, velocity_y, alive
+    barriers  (num_envs, barriers, 4)  x, y, width, height (never change)
+
+The reward of a controlled player is the change of its score (see
+Player.calculate_score). An episode terminates when the game is finished
+or all controlled players have won or lost all their lifes, and is
+truncated after max_episode_steps. Finished worlds are reset
+automatically with a new seed (seed + num_envs), the returned
+observation is then the first one of the new episode. The last
+observation and info of the finished episode are in
+infos["final_observation"] and infos["final_info"] (as in
+gymnasium.vector, with the masks "_final_observation"/"_final_info").
+
+With processes > 1 the worlds are split between that many worker
+processes.
+
+Run "python -m v7.vec_env" for a benchmark.
+"""
+
+PLAYER_FEATURES = 8
+ENEMY_FEATURES = 5
+BARRIER_FEATURES = 4
+
+
+class WorldBatch:
+
+    # Some worlds simulated in the current process (see VecEnv)
+    def __init__(
+            self, num_envs, controlled_players=1, steps_per_action=5, max_episode_steps=60 * 60, seed_increment=None
+    ):
+        self.num_envs = num_envs
+        self.controlled_players = controlled_players
+        self.steps_per_action = steps_per_action
+        self.max_episode_steps = max_episode_steps
+
+        self.worlds = [None] * num_envs
+        self.seeds = [None] * num_envs
+        self.seed_increment = num_envs if seed_increment is None else seed_increment
+        self.episode_steps = np.zeros(num_envs, dtype=int)
+
+        # The state right after creating the world of a seed, resetting
+        # to the same seed only has to restore it (see v7/snapshot.py)
+        self.initial_snapshots = [None] * num_envs
+
+        # Array sizes (the largest world of the first reset)
+        self.player_count = None
+        self.enemy_count = None
+        self.barriers = None
+
+    def reset_world(self, i, seed):
+        if seed == self.seeds[i] and self.worlds[i] is not None:
+            restore(self.worlds[i], self.initial_snapshots[i])
+        else:
+            self.worlds[i] = create_seeded_world(seed)
+            self.seeds[i] = seed
+            self.initial_snapshots[i] = snapshot(self.worlds[i])
+        self.episode_steps[i] = 0
+
+    def reset(self, seeds):
+        assert len(seeds) == self.num_envs, "Expected one seed per world"
+        for i, seed in enumerate(seeds):
+            self.reset_world(i, seed)
+
+        if self.player_count is None:
+            self.player_count = max(len(world.players) for world in self.worlds)
+            self.enemy_count = max(len(world.all_enemies) for world in self.worlds)
+            barrier_count = max(len(world.barriers) for world in self.worlds)
+            self.barriers = np.zeros((self.num_envs, barrier_count, BARRIER_FEATURES))
+        for i, world in enumerate(self.worlds):
+            for j, barrier in enumerate(world.barriers):
+                self.barriers[i, j] = (*barrier.position, *barrier.size)
+
+        return self.get_observations(), {"scores": self.get_scores()}
+
+    def get_scores(self):
+        scores = np.zeros((self.num_envs, self.controlled_players))
+        for i, world in enumerate(self.worlds):
+            for j in range(self.controlled_players):
+                scores[i, j] = world.players[j].score
+        return scores
+
+    def get_observations(self):
+        players = np.zeros((self.num_envs, self.player_count, PLAYER_FEATURES))
+        enemies = np.zeros((self.num_envs, self.enemy_count, ENEMY_FEATURES))
+        for i, world in enumerate(self.worlds):
+            players[i, :len(world.players)] = [
+                (*player.position, *player.velocity, player.lifes_left, player.enemies_killed, player.score, player.won)
+                for player in world.players
+            ]
+            # Enemies are always in the same row (the enemy_id)
+            for enemy in world.enemies:
+                if enemy.enemy_id < self.enemy_count:
+                    enemies[i, enemy.enemy_id] = (*enemy.position, *enemy.velocity, 1)
+
+            # Swarm enemies (see NUMPY_ENEMIES) are copied from the arrays
+            swarm = world.enemy_swarm
+            if swarm is not None and len(swarm) > 0:
+                n = len(swarm)
+                rows = swarm.enemy_ids[:n]
+                known = rows < self.enemy_count
+                enemies[i, rows[known], 0:2] = swarm.positions[:n][known]
+                enemies[i, rows[known], 2:4] = swarm.velocities[:n][known]
+                enemies[i, rows[known], 4] = 1
+        return {"players": players, "enemies": enemies, "barriers": self.barriers.copy()}
+
+    # The game goes on for the other players, but not for the agents
+    def is_finished(self, world):
+        return all(player.won or player.lifes_left == 0 for player in world.players[:self.controlled_players])
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=int).reshape(self.num_envs, self.controlled_players)
+        timedelta = 1 / PHYSICS_HZ
+        previous_scores = self.get_scores()
+        terminated = np.zeros(self.num_envs, dtype=bool)
+
+        for i, world in enumerate(self.worlds):
+            for j in range(self.controlled_players):
+                set_input(world.players[j], actions[i, j])
+            for step in range(self.steps_per_action):
+                world.update_all(timedelta)
+                check_for_win(world)
+                if world.game_finish_time is not None or self.is_finished(world):
+                    terminated[i] = True
+                    break
+        self.episode_steps += 1
+
+        scores = self.get_scores()
+        rewards = scores - previous_scores
+        truncated = ~terminated & (self.episode_steps >= self.max_episode_steps)
+        observations = self.get_observations()
+        infos = {"scores": scores}
+
+        # Autoreset the finished worlds with a new seed. Like in
+        # gymnasium.vector, their last observation and info are kept in
+        # final_observation and final_info (None for the other worlds)
+        finished = terminated | truncated
+        if finished.any():
+            final_observations = np.full(self.num_envs, None, dtype=object)
+            final_infos = np.full(self.num_envs, None, dtype=object)
+            for i in np.flatnonzero(finished):
+                final_observations[i] = {key: value[i] for key, value in observations.items()}
+                final_infos[i] = {"scores": scores[i]}
+                self.reset_world(i, self.seeds[i] + self.seed_increment)
+
+            observations = self.get_observations()
+            infos = {
+                "scores": self.get_scores(),
+                "final_observation": final_observations, "_final_observation": finished,
+                "final_info": final_infos, "_final_info": finished
+            }
+        return observations, rewards, terminated, truncated, infos
+
+
+# Runs a WorldBatch in a worker process
+def run_worker(connection, kwargs):
+    batch = WorldBatch(**kwargs)
+    while True:
+        command, data = connection.recv()
+        if command == "reset":
+            connection.send(batch.reset(data))
+        elif command == "step":
+            connection.send(batch.step(data))
+        else:
+            break
+    connection.close()
+
+
+class VecEnv:
+
+    def __init__(self, num_envs, controlled_players=1, steps_per_action=5, max_episode_steps=60 * 60, processes=1):
+        assert num_envs >= processes >= 1, "Expected at least one world per process"
+        self.num_envs = num_envs
+        self.controlled_players = controlled_players
+
+        # The worlds [splits[k], splits[k + 1]) belong to process k
+        self.splits = [num_envs * k // processes for k in range(processes + 1)]
+        kwargs = [
+            dict(
+                num_envs=self.splits[k + 1] - self.splits[k], controlled_players=controlled_players,
+                steps_per_action=steps_per_action, max_episode_steps=max_episode_steps, seed_increment=num_envs
+            )
+            for k in range(processes)
+        ]
+
+        self.batch = None
+        self.connections = []
+        self.workers = []
+        if processes == 1:
+            self.batch = WorldBatch(**kwargs[0])
+        else:
+            for k in range(processes):
+                connection, worker_connection = multiprocessing.Pipe()
+                worker = multiprocessing.Process(target=run_worker, args=(worker_connection, kwargs[k]), daemon=True)
+                worker.start()
+                self.connections.append(connection)
+                self.workers.append(worker)
+
+    # Sends one part of data to every worker and joins their results
+    def run(self, command, data):
+        if self.batch is not None:
+            return getattr(self.batch, command)(data)
+
+        for k, connection in enumerate(self.connections):
+            connection.send((command, data[self.splits[k]:self.splits[k + 1]]))
+        results = [connection.recv() for connection in self.connections]
+        sizes = [self.splits[k + 1] - self.splits[k] for k in range(len(self.connections))]
+        return join_results(results, sizes)
+
+    def reset(self, seeds=None):
+        if seeds is None:
+            seeds = range(self.num_envs)
+        return self.run("reset", list(seeds))
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=int).reshape(self.num_envs, self.controlled_players)
+        return self.run("step", actions)
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(("close", None))
+        for worker in self.workers:
+            worker.join()
+        self.connections, self.workers = [], []
+
+
+# Concatenates the (tuples/dicts of) arrays of all workers. The
+# final_observation/final_info entries are only returned by the workers
+# where a world has been reset, for the others they are filled in
+def join_results(results, sizes):
+    first = results[0]
+    if isinstance(first, tuple):
+        return tuple(join_results([result[i] for result in results], sizes) for i in range(len(first)))
+    if isinstance(first, dict):
+        keys = list(dict.fromkeys(key for result in results for key in result))
+        return {
+            key: join_results([
+                result[key] if key in result else
+                np.zeros(size, dtype=bool) if key.startswith("_") else np.full(size, None, dtype=object)
+                for result, size in zip(results, sizes)
+            ], sizes)
+            for key in keys
+        }
+    return np.concatenate(results)
+
+
+if __name__ == '__main__':
+    # Benchmark: Environment steps per second (all worlds together) with
+    # random actions for 1 process vs. one process per core (at least 2)
+    import os
+    import time
+
+    num_envs = 32
+    steps = 100
+    rng = np.random.default_rng(0)
+
+    for processes in sorted({1, max(2, os.cpu_count() or 1)}):
+        for steps_per_action in (1, 5):
+            env = VecEnv(num_envs, steps_per_action=steps_per_action, processes=processes)
+            observations, infos = env.reset(seeds=range(num_envs))
+            assert observations["players"].shape == (num_envs, 2, PLAYER_FEATURES)
+
+            start_time = time.perf_counter()
+            total_reward = 0
+            for step in range(steps):
+                actions = rng.integers(0, 16, size=num_envs)
+                observations, rewards, terminated, truncated, infos = env.step(actions)
+                total_reward += rewards.sum()
+            duration = time.perf_counter() - start_time
+            env.close()
+
+            print(
+                f"{processes:>2} processes, {steps_per_action} simulation steps per action: "
+                f"{num_envs * steps / duration:8.0f} env steps/s "
+                f"({num_envs * steps * steps_per_action / duration:8.0f} simulation steps/s)"
+            )
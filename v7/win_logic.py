@@ -5,15 +5,14 @@ from datetime import datetime
 # Constants
 from engine_v2.constants import *
 
-# Components
-from v7.player import Player
 
+# Updates world.sorted_scores and world.game_finish_time (v7/world.py)
+def check_for_win(world):
+    win_area = world.win_area
 
-def check_for_win(win_area, sorted_scores, game_finish_time):
+    if world.game_finish_time is None:
 
-    if game_finish_time is None:
-
-        for player in Player.instances:
+        for player in world.players:
             # If a player enters the win_area (the flag pole)
             # then the player.won property gets set to true and
             # the player cannot move anymore
@@ -26,12 +25,12 @@ def check_for_win(win_area, sorted_scores, game_finish_time):
             # If a players have reached the win_area or have no
             # lifes left then the game os finished -> generate scores
             # and save the game_finish_time
-        if all([(player.won or player.lifes_left == 0) for player in Player.instances]):
+        if all([(player.won or player.lifes_left == 0) for player in world.players]):
             scores = [
                 {"name": player.name, "score": player.score}
-                for player in Player.instances
+                for player in world.players
             ]
-            sorted_scores = list(sorted(scores, key=lambda player: player["score"], reverse=True))
-            game_finish_time = datetime.now()
+            world.sorted_scores = list(sorted(scores, key=lambda player: player["score"], reverse=True))
+            world.game_finish_time = datetime.now()
 
-    return sorted_scores, game_finish_time
+    return world.sorted_scores, world.game_finish_time
@@ -0,0 +1,136 @@
+
+# Engine
+from engine_v2.spatial_grid import SpatialGrid
+from engine_v2.sweep_and_prune import SweepAndPrune
+
+# Constants
+from engine_v2.constants import *
+
+# Components
+from v7.barrier import Barrier
+from v7.enemy import Enemy
+from v7.player import Player
+
+
+"""
+A World contains everything that belongs to one running game: its
+barriers, enemies and players (plus the broadphase structures used to
+find their collisions) and the game's scores.
+
+Every Barrier, Enemy and Player belongs to exactly one world, which is
+passed to its constructor:
+
+    world = World()
+    Barrier(world, x_left=-1, y_top=1, width=52, height=1)
+    Enemy(world, position=(2, 2))
+
+    world.update_all(timedelta)
+    world.draw_all(game, alpha)
+
+All collisions are only detected between objects of the same world, so
+one process can run many independent games at once (e.g. a server with
+many matches).
+"""
+
+
+class World:
+
+    def __init__(
+            self,
+            continuous_collisions=CONTINUOUS_COLLISIONS,
+            cell_size=SPATIAL_GRID_CELL_SIZE,
+            win_area=((46.5, 47.5), (1, 13)),
+            noise_stream=NOISE_STREAM
+    ):
+        # All Barrier instances, also sorted into a uniform grid. Since
+        # barriers never move, they only have to be inserted once
+        self.barriers = []
+        self.barrier_grid = SpatialGrid(cell_size)
+
+        # Incremented whenever a barrier is added or the barriers are merged
+        # (Barrier.coalesce_all). Barriers are drawn onto a cached layer
+        # that is only redrawn when this changes
+        self.barrier_version = 0
+
+        # With continuous collisions the moving objects are swept from their
+        # last position to their new position, so they cannot pass through
+        # thin barriers even with very large timesteps
+        self.continuous_collisions = continuous_collisions
+
+        # All Enemy instances, also sorted along the x-axis (broadphase
+        # for the combat collisions with the players)
+        self.enemies = []
+        self.enemy_sweep = SweepAndPrune()
+
+        # Every Enemy instance ever created in this world, the index is
+        # the enemy_id. Killed enemies stay in here, so that restoring
+        # an older snapshot can bring them back (see v7/snapshot.py).
+        # The ids of swarm enemies are reserved with None
+        self.all_enemies = []
+
+        # Optional NumPy backend simulating additional enemies as arrays
+        # (see v7/enemy_swarm.py and NUMPY_ENEMIES) and optional NoiseBank
+        # shared by all enemies (see NOISE_BANK)
+        self.enemy_swarm = None
+        self.noise_bank = None
+
+        # Give new enemies an endless PerlinNoiseStream (see NOISE_STREAM)
+        self.noise_stream = noise_stream
+
+        # All Player instances, also sorted along the x-axis (broadphase
+        # for the collisions between players)
+        self.players = []
+        self.player_sweep = SweepAndPrune()
+
+        # See v7/win_logic.py
+        self.win_area = win_area
+        self.sorted_scores = []
+        self.game_finish_time = None
+
+    def update_all(self, timedelta):
+        # Only the moving objects have to be updated
+        Enemy.update_all(self, timedelta)
+        Player.update_all(self, timedelta)
+
+    # alpha is the time between the last and the next simulation
+    # frame, the moving objects will be drawn in between
+    def draw_all(self, game, alpha=1):
+        Barrier.draw_all(self, game)
+        Enemy.draw_all(self, game, alpha)
+        Player.draw_all(self, game, alpha)
+
+    # All collisions of a moving object in this world with barriers (and
+    # other players, when moving_object is a player)
+    def detect_all_collisions(self, moving_object, start_position=None):
+        assert moving_object.world is self, "The moving object belongs to another world"
+        record = Barrier.detect_all_collisions(moving_object, start_position=start_position)
+        if isinstance(moving_object, Player):
+            Player.detect_all_collisions(moving_object, record=record)
+        return record
+
+
+if __name__ == '__main__':
+    # Benchmark: Simulating 1 world vs. 64 worlds in one process (the
+    # level from v7.main in every world). 64 worlds should take about
+    # 64 times as long as one world
+    import random
+    import time
+    from v7.main import create_world
+
+    random.seed(0)
+    for world_count in (1, 8, 64):
+        worlds = [create_world() for i in range(world_count)]
+        for world in worlds:
+            world.players[0].keypressed['RIGHT'] = True
+
+        steps = 300
+        start_time = time.perf_counter()
+        for step in range(steps):
+            for world in worlds:
+                world.update_all(1/PHYSICS_HZ)
+        duration = time.perf_counter() - start_time
+
+        print(
+            f"{world_count:>3} worlds: {steps * world_count / duration:8.0f} world steps/s "
+            f"({duration / steps / world_count * 1e6:6.1f} us per world step)"
+        )